@@ -0,0 +1,81 @@
+import io
+import json
+import uuid
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_preprocess import IMAGENET_MEAN, IMAGENET_STD
+
+# -----------------------------
+# Prediction overlay on the RGB input
+# -----------------------------
+
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png", {}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+
+
+def load_font(size=16):
+    for name in ("arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+# looked up once at import instead of on every request
+ANNOTATION_FONT = load_font()
+
+
+def to_pil(rgb_tensor):
+    """(3, H, W) or (1, 3, H, W) ImageNet-normalized tensor -> PIL image"""
+    image = rgb_tensor.detach().cpu().float().reshape((1,) + tuple(rgb_tensor.shape[-3:]))
+    image = image.mul(IMAGENET_STD).add_(IMAGENET_MEAN).clamp_(0, 1).mul_(255).round_()
+    return Image.fromarray(image[0].permute(1, 2, 0).byte().numpy())
+
+
+def annotate_rgb(rgb_tensor, predicted_class_name, true_class_name=None):
+    """RGB input with the predicted (and true, if known) class drawn on it"""
+    image = to_pil(rgb_tensor)
+    draw = ImageDraw.Draw(image)
+
+    y_offset = 10
+    draw.text((10, y_offset), f"Predicted: {predicted_class_name}", fill=(255, 255, 255), font=ANNOTATION_FONT)
+    y_offset += 25
+    if true_class_name:
+        draw.text((10, y_offset), f"True: {true_class_name}", fill=(0, 255, 0), font=ANNOTATION_FONT)
+    return image
+
+
+def encode_image(image, image_format="png"):
+    """(bytes, mimetype) of the image in one of IMAGE_FORMATS"""
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image_format {image_format!r}, expected one of {sorted(IMAGE_FORMATS)}")
+    pil_format, mimetype, options = IMAGE_FORMATS[image_format]
+    buf = io.BytesIO()
+    image.save(buf, pil_format, **options)
+    return buf.getvalue(), mimetype
+
+
+def multipart_result(result, image_bytes, image_mimetype, image_name="annotated"):
+    """
+    (body, content type) of a multipart/mixed response with the JSON result as the first
+    part and the annotated image as the second.
+    """
+    boundary = uuid.uuid4().hex
+    extension = image_mimetype.split("/")[-1]
+    body = b"".join([
+        f"--{boundary}\r\n".encode(),
+        b"Content-Type: application/json\r\n",
+        b'Content-Disposition: inline; name="result"\r\n\r\n',
+        json.dumps(result).encode("utf-8"),
+        f"\r\n--{boundary}\r\n".encode(),
+        f"Content-Type: {image_mimetype}\r\n".encode(),
+        f'Content-Disposition: inline; name="image"; filename="{image_name}.{extension}"\r\n\r\n'.encode(),
+        image_bytes,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return body, f"multipart/mixed; boundary={boundary}"
@@ -2,25 +2,32 @@ import os
 import io
 import torch
 import torch.nn as nn
-import torchvision.models as models
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context
 from flask_cors import CORS
-from utils import getAnswer, getAnswerWithImage
-import matplotlib.pyplot as plt
 import base64
-import gpytorch
-import pandas as pd
+import hashlib
+import json
+import time
+import shutil
+import tempfile
+from concurrent.futures import BrokenExecutor
+from collections import namedtuple
 import numpy as np
-import geopandas as gpd
-import sklearn
-from tqdm import tqdm
-import matplotlib
-from timm.models import create_model
-import torchvision.transforms as T
-from PIL import Image, ImageDraw, ImageFont
 
-from pest_risk_decision.gp_model import GPClassificationModel
-from utils import expected_cost, expected_hat_cost , e_c_hat_given_no_ppi,e_c_hat_given_ppi, evppi,e_u_gamma
+from subsystems import Subsystem, SubsystemUnavailable, SUBSYSTEM_WAIT_SECONDS
+from render_cache import RenderCache, make_key
+from batcher import MicroBatcher
+from ingest import iter_survey, as_input, load_upload, parse_label, read_upload, HSI_SHAPE, RGB_SHAPE
+from backends import load_backend
+from embedding_cache import EmbeddingCache
+from calibration import file_digest
+from image_preprocess import decode_images, normalize as normalize_images
+from annotate import annotate_rgb, encode_image, multipart_result
+from precision import select_precision, unwrap_precision, load_reference_set, synthetic_reference_set, \
+    MIN_TOP1_AGREEMENT, MAX_LOGIT_DRIFT
+from pest_risk_pipeline import pest_risk, parse_days, iter_risk_days, iter_risk_chunks, risk_day_record, \
+    warm_worker, render_map_job, MAX_MAP_DAYS
+from jobs import JobQueue, QueueFull
 
 # -----------------------------
 # Model Definitions for DualStreamFusionModel
@@ -47,6 +54,8 @@ class AHAM(nn.Module):
 class SimCLR(nn.Module):
     def __init__(self, backbone="vit_base_patch16_224", feature_dim=128, input_channels=100):
         super(SimCLR, self).__init__()
+        from timm.models import create_model
+
         self.encoder = create_model(backbone, pretrained=False, num_classes=0)
 
         # Replace input conv for HSI input
@@ -79,6 +88,8 @@ class SimCLR(nn.Module):
 class DualStreamFusionModel(nn.Module):
     def __init__(self, hsi_ssl_model, num_classes=3):
         super(DualStreamFusionModel, self).__init__()
+        import torchvision.models as models
+
         self.hsi_encoder = hsi_ssl_model
         for param in self.hsi_encoder.parameters():
             param.requires_grad = False
@@ -93,6 +104,10 @@ class DualStreamFusionModel(nn.Module):
 
     def forward(self, hsi, rgb):
         hsi_features = self.hsi_encoder(hsi)
+        return self.forward_from_hsi_features(hsi_features, rgb)
+
+    def forward_from_hsi_features(self, hsi_features, rgb):
+        # the HSI encoder is frozen, so its features can be computed once and reused
         rgb_features = self.rgb_encoder(rgb)
         fused_features = torch.cat([hsi_features, rgb_features], dim=1)
         logits = self.classifier(fused_features)
@@ -131,105 +146,174 @@ def convert_numpy_types(obj):
     return obj
 
 # -----------------------------
-# Load DualStreamFusion Model
+# Subsystems
+#
+# chat, pest_risk and dual_stream are built on first use (or in background threads when
+# started with `python app.py`), so the server answers as soon as Flask is up and a slow
+# model load only holds back the routes that need it.
 # -----------------------------
 device = torch.device("cpu")
 
-class_names = ["Health", "non-rust disease", "yellow rust disease"]
+script_dir = os.path.dirname(os.path.abspath(__file__))
 
-hsi_model_architecture = SimCLR(input_channels=100)
-dual_stream_model = DualStreamFusionModel(hsi_model_architecture, num_classes=len(class_names))
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, "models", "dual_stream_fusion_model.pth")
+def load_chat():
+    # langchain and the Gemini client are only imported here
+    import utils
+    return utils
 
-# Add error handling for model loading
-try:
-    dual_stream_model.load_state_dict(torch.load(model_path, map_location=device))
-    dual_stream_model.eval()
-    print(f"DualStream model loaded successfully from {model_path}")
-except FileNotFoundError:
-    print(f"Warning: DualStream model file not found at {model_path}")
-    print("The API will still run but DualStream predictions will fail until model is available")
+
+chat = Subsystem("chat", load_chat)
 
 # -----------------------------
-# Load Pest Risk Model
+# Load DualStreamFusion Model
 # -----------------------------
-e_c_loss_treatment = 0  
-e_c_loss_no_treatment = 868                                   
-e_c_treatment_application = 795                                 
-e_c_monitoring = 48                                            
-e_c_treatment_treatment = e_c_treatment_application/10 - 24  
-
-n_covars = 270
-N_INDUCING_POINTS = 24 
-
-placeholder_inducing_points = torch.randn(N_INDUCING_POINTS, 273).to(device)
-loaded_model = GPClassificationModel(inducing_points=placeholder_inducing_points, n_covars=n_covars).to(device)
-loaded_likelihood = gpytorch.likelihoods.BernoulliLikelihood().to(device)
-
-loaded_model.load_state_dict(torch.load('models/pest_risk_model_state.pth', map_location=torch.device('cpu')))
-loaded_likelihood.load_state_dict(torch.load('models/pest_risk_likelihood_state.pth', map_location=torch.device('cpu')))
-
-loaded_model.eval()
-loaded_likelihood.eval()
-
-print("Pest risk model and likelihood state dictionaries loaded.")
-
-variables = [
-    "temperature",
-    "relative_humidity",
-    "solar_radiation",
-    "total_evaporation_sum",
-    "wind_speed",
-    "surface_pressure",
-    "precipitation",
-    "leaf_area_index_high_vegetation",
-    "leaf_area_index_low_vegetation",
-]
-
-suffixes = [""]
-
-for lag_i in range(1, 30):
-    suffixes.append(f"_l{lag_i}")
-
-vars = []
-for var in variables:
-    for suffix in suffixes:
-        vars.append(var+suffix)
-
-from pest_risk_decision.utils import DataPreprocessor, \
-    destandardize_date, \
-    plot_cross_validation_roc, \
-    beauty_print_date
-
-reference_day = pd.Timestamp("2018-01-01")
-
-location_min = np.array([12.587, 76.770])
-
-df = pd.read_feather('pest_risk_decision/data/combined_synthetic1.feather')
-data_preprocessor = DataPreprocessor(
-    df,
-    vars,
-    "presence",
-    location_min,
-)
-XY = data_preprocessor.get_XY(df)
+class_names = ["Health", "non-rust disease", "yellow rust disease"]
+
+model_path = os.path.join(script_dir, "models", "dual_stream_fusion_model.pth")
+
+DualStream = namedtuple("DualStream", [
+    "model", "inference_model", "precision_report", "backend", "runner", "embedding_cache", "batcher",
+])
+
 
-N_CV_SPLITS = 2
+def load_dual_stream():
+    hsi_model_architecture = SimCLR(input_channels=100)
+    dual_stream_model = DualStreamFusionModel(hsi_model_architecture, num_classes=len(class_names))
 
-X = torch.from_numpy(data_preprocessor.get_X_numpy(df)).float().contiguous().to(device)
-y = torch.from_numpy(data_preprocessor.get_Y_numpy(df)).int().contiguous().to(device)
-cv = sklearn.model_selection.TimeSeriesSplit(n_splits=N_CV_SPLITS)
+    # Add error handling for model loading
+    try:
+        dual_stream_model.load_state_dict(torch.load(model_path, map_location=device))
+        dual_stream_model.eval()
+        print(f"DualStream model loaded successfully from {model_path}")
+    except FileNotFoundError:
+        print(f"Warning: DualStream model file not found at {model_path}")
+        print("The API will still run but DualStream predictions will fail until model is available")
+
+    # optional reduced precision (int8 / bf16), only enabled if it agrees with fp32 on a reference set
+    dual_stream_precision = os.environ.get("DUAL_STREAM_PRECISION", "fp32")
+    if dual_stream_precision != "fp32":
+        reference_set_path = os.environ.get("DUAL_STREAM_REFERENCE_SET")
+        if reference_set_path:
+            reference_batches = load_reference_set(reference_set_path)
+        else:
+            print("No DUAL_STREAM_REFERENCE_SET given, checking precision on synthetic inputs")
+            reference_batches = synthetic_reference_set()
+        inference_model, precision_report = select_precision(
+            dual_stream_model,
+            dual_stream_precision,
+            reference_batches,
+            min_agreement=float(os.environ.get("DUAL_STREAM_MIN_AGREEMENT", MIN_TOP1_AGREEMENT)),
+            max_drift=float(os.environ.get("DUAL_STREAM_MAX_DRIFT", MAX_LOGIT_DRIFT)),
+        )
+    else:
+        inference_model, precision_report = dual_stream_model, {"mode": "fp32", "enabled": True}
+
+    max_batch = int(os.environ.get("DUAL_STREAM_MAX_BATCH", 8))
+
+    # eager, torchscript or onnxruntime, warmed up before the first request; a backend that
+    # fails to export or load comes back as "eager"
+    backend, runner = load_backend(
+        inference_model,
+        os.environ.get("DUAL_STREAM_BACKEND", "eager"),
+        model_path,
+        tag=precision_report["mode"] if precision_report["enabled"] else "fp32",
+        warmup_batch_sizes=(1, max_batch),
+    )
+
+    # opt-in cache of frozen HSI encoder outputs; needs the eager modules, so compiled backends
+    # skip it, and trained weights, since a random init differs per process
+    embedding_cache = None
+    embedding_cache_mb = float(os.environ.get("HSI_EMBEDDING_CACHE_MB", 0))
+    if embedding_cache_mb > 0 and backend == "eager" and os.path.exists(model_path):
+        embedding_cache = EmbeddingCache(
+            f"{file_digest([model_path])}-{precision_report['mode'] if precision_report['enabled'] else 'fp32'}",
+            max_bytes=int(embedding_cache_mb * 1024 * 1024),
+            spill_dir=os.environ.get("HSI_EMBEDDING_SPILL_DIR") or None,
+            spill_max_bytes=int(float(os.environ.get("HSI_EMBEDDING_SPILL_MB", 512)) * 1024 * 1024),
+        )
+
+    state = DualStream(dual_stream_model, inference_model, precision_report, backend, runner, embedding_cache, None)
+
+    # concurrent /predict_dual_stream requests share one batched forward pass
+    batcher = MicroBatcher(
+        lambda hsi, rgb: run_dual_stream(state, hsi, rgb),
+        max_batch_size=max_batch,
+        max_wait_ms=float(os.environ.get("DUAL_STREAM_MAX_WAIT_MS", 5)),
+        name="dual-stream-batcher",
+    )
+    return state._replace(batcher=batcher)
+
+
+def run_dual_stream_cached(state, hsi, rgb):
+    fusion_model, precision_context = unwrap_precision(state.inference_model)
+    cache = state.embedding_cache
+    keys = [cache.key(cube) for cube in hsi]
+    features = [cache.get(key) for key in keys]
+    missing = [i for i, feature in enumerate(features) if feature is None]
+
+    with torch.no_grad(), precision_context():
+        if missing:
+            computed = fusion_model.hsi_encoder(hsi[missing]).float()
+            for i, feature in zip(missing, computed):
+                features[i] = feature
+                cache.put(keys[i], feature)
+        return fusion_model.forward_from_hsi_features(torch.stack(features), rgb).float()
+
+
+def run_dual_stream(state, hsi, rgb):
+    if state.embedding_cache is not None:
+        return run_dual_stream_cached(state, hsi, rgb)
+    with torch.no_grad():
+        return state.runner(hsi, rgb)
+
+
+dual_stream = Subsystem("dual_stream", load_dual_stream)
+
+SUBSYSTEMS = {subsystem.name: subsystem for subsystem in (chat, pest_risk, dual_stream)}
 
-train_idxs = X[:, 2] <= 1460/365
-test_idxs = (X[:, 2] > 1460/365) & (X[:, 2] <= 1825/365)
 
-train_X = X[train_idxs, :]
-test_X = X[test_idxs, :]
-train_y = y[train_idxs]
-test_y = y[test_idxs]
-days = np.array([1461, 1551, 1704])
+@app.errorhandler(SubsystemUnavailable)
+def subsystem_unavailable(e):
+    response = jsonify({"error": str(e), "subsystem": e.name})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+@app.errorhandler(QueueFull)
+def job_queue_full(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+# risk maps are rendered in a bounded pool of worker processes that already hold the GP
+# model and geodata, so a render neither blocks nor races the request threads.
+# Every server worker (GUNICORN_WORKERS, set by gunicorn.conf.py) gets its own pool and each
+# pool process holds its own GP copy, so PEST_RISK_JOB_WORKERS is split across them as a
+# per-host budget, and the cores across every render process on the host.
+server_workers = max(1, int(os.environ.get("GUNICORN_WORKERS", 1)))
+pest_risk_job_workers = max(1, int(os.environ.get("PEST_RISK_JOB_WORKERS", 2)) // server_workers)
+pest_risk_job_threads = max(1, (os.cpu_count() or 1) // (server_workers * pest_risk_job_workers))
+pest_risk_job_ttl = float(os.environ.get("PEST_RISK_JOB_TTL_SECONDS", 600))
+# how long /predict waits for its render before answering 504 (the job keeps running)
+pest_risk_job_timeout = float(os.environ.get("PEST_RISK_JOB_TIMEOUT_SECONDS", 90))
+pest_risk_jobs = JobQueue(
+    max_workers=pest_risk_job_workers,
+    max_pending=int(os.environ.get("PEST_RISK_JOB_MAX_PENDING", 16)),
+    initializer=warm_worker,
+    initargs=(pest_risk_job_threads,),
+    ttl_seconds=pest_risk_job_ttl,
+    name="pest-risk-jobs",
+)
+
+# rendered maps, keyed on model version, days and form inputs
+render_cache = RenderCache(
+    os.path.join(UPLOAD_FOLDER, "render_cache"),
+    max_bytes=int(os.environ.get("RENDER_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+)
 
 # -----------------------------
 # Routes
@@ -279,6 +363,7 @@ def upload_image():
     
 @app.route('/chats', methods=['POST'])
 def handle_chats():
+    chat_api = chat.get(SUBSYSTEM_WAIT_SECONDS)
     try:
         messages = request.form.get("messages", "[]")
         query = request.form.get("query", "")
@@ -286,243 +371,302 @@ def handle_chats():
         image = request.files.get("image", None)
         print(language)
 
-        if image:
-            # Make sure the directory exists
-            os.makedirs("chats", exist_ok=True)
-
-            # Use image.filename instead of image object
-            image_path = os.path.join("chats", image.filename)
-            image.save(image_path)
+        # tokens over Server-Sent Events as the model produces them
+        stream = stream_format(("sse",)) == "sse"
 
-            response = getAnswerWithImage(messages, query, language, image_path)
+        if image:
+            # kept in memory; utils downscales it before it is sent to the model
+            image_bytes = image.read()
+            try:
+                chat_api.check_image(image_bytes)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-            # optional cleanup
-            os.remove(image_path)
+            if stream:
+                return stream_chat_answer(chat_api.streamAnswerWithImage(messages, query, language, image_bytes))
 
+            response = chat_api.getAnswerWithImage(messages, query, language, image_bytes)
             return jsonify(response), 200
 
         if not query:
             return jsonify({'error': 'No query provided'}), 400
 
-        response = getAnswer(messages, query, language)    
+        if stream:
+            return stream_chat_answer(chat_api.streamAnswer(messages, query, language))
+
+        response = chat_api.getAnswer(messages, query, language)    
         return jsonify(response), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/predict', methods=['POST'])
-def model2():
-    file = request.files['file']
-    surface_pressure = request.form.get('surfacePressure')
-    wind_speed = request.form.get('windSpeed')
-    relative_humidity = request.form.get('relativeHumidity')
-    total_evaporation = request.form.get('totalEvaporation')
-
-    X = torch.from_numpy(data_preprocessor.get_X_numpy(df)).float().contiguous().to(device)
-    grid = gpd.read_file("pest_risk_decision/data/grid.geojson")
-    wdf = pd.read_feather("pest_risk_decision/data/total_processed.feather")
-    crs = 4326
-    states = gpd.read_file("India-State-and-Country-Shapefile-Updated-Jan-2020/India_State_Boundary.shp")
-    states.to_crs(epsg=crs, inplace=True)
-    ap_geometry = states.loc[states.State_Name=="Andhra Pradesh"].geometry.iat[0]
-
-    ap_within = grid.intersects(ap_geometry)
-    with torch.no_grad():
-        pred_y_test_loaded = loaded_likelihood(loaded_model(test_X)).mean.cpu().numpy()
-    scaling_factor = 0.11 / pred_y_test_loaded.mean()
-    # print(f"Calculated scaling factor: {scaling_factor:.4f}")
-    sample_X = test_X[2, :].unsqueeze(0)
 
-    with torch.no_grad():
-        loaded_model.eval()
-        loaded_likelihood.eval()
-        pred_sample = loaded_likelihood(loaded_model(sample_X))
-        predicted_prob = pred_sample.mean.item() * scaling_factor
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
 
-    # print(f"Predicted probability for the sample: {predicted_prob:.4f}")
 
-    wdf_days = []
-    for i, day in tqdm(enumerate(days[:3])):
-        # use a particular day
-        wdf_day = wdf.loc[wdf["date"] == day].copy() 
+def stream_format(formats):
+    """
+    Which of `formats` ("ndjson", "sse") the client asked for with `stream=` or the Accept
+    header, or None. `stream=1/true/yes` picks the first of `formats`, 0/false/no none.
+    """
+    value = (request.values.get("stream") or "").strip().lower()
+    if value:
+        if value in ("1", "true", "yes", "on"):
+            return formats[0]
+        if value in STREAM_MIMETYPES.values():
+            value = next(fmt for fmt, mimetype in STREAM_MIMETYPES.items() if mimetype == value)
+        return value if value in formats else None
 
-        wdf_day = gpd.GeoDataFrame(pd.merge(wdf_day, grid, on="cell_id", how="left"))
-        centroids = wdf_day["geometry"].to_crs('EPSG:7755').centroid.to_crs('EPSG:4326')
-        wdf_day["longitude"] = centroids.x
-        wdf_day["latitude"] = centroids.y
+    best = request.accept_mimetypes.best_match(["application/json"] + [STREAM_MIMETYPES[fmt] for fmt in formats])
+    return next((fmt for fmt in formats if STREAM_MIMETYPES[fmt] == best), None)
 
-        wdf_day.dropna(inplace=True)
 
-        X_map = torch.from_numpy(data_preprocessor.get_X_numpy(wdf_day)).float().contiguous().to(device)
-
-        test_day = day / 365
-        obs_mask_test = test_X[:, 2] < test_day
-        obs_mask_train = train_X[:, 2] < test_day
-
-        obs_X = torch.vstack((train_X[obs_mask_train], test_X[obs_mask_test, :]))#[-14000:, :]
-        obs_y = torch.cat((train_y[obs_mask_train], test_y[obs_mask_test]))#[-14000:]
-
-        # fit the SVI
-
-        inference_model = loaded_model
-        inference_likelihood = loaded_likelihood
-
-        inference_model.eval()
-        inference_likelihood.eval()
-
-        with torch.no_grad():
-            pred_map = inference_likelihood(inference_model(X_map))
-            wdf_day["gp_pred"] = pred_map.mean.cpu().numpy() * scaling_factor
+def stream_chat_answer(tokens):
+    """SSE response: one `token` event per chunk, then `done` with the full answer"""
+    def generate():
+        answer = []
+        try:
+            for token in tokens:
+                answer.append(token)
+                yield f"event: token\ndata: {json.dumps({'text': token})}\n\n"
+            yield f"event: done\ndata: {json.dumps({'answer': ''.join(answer)})}\n\n"
+        except Exception as e:
+            app.logger.exception("Error in stream_chat_answer")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
-        wdf_days.append(wdf_day)
+# -----------------------------
+# Pest risk map routes
+# -----------------------------
 
-    # Create one giant map visualization using the loaded model.
-    fig, axs = plt.subplots(3, 3, figsize=(12, 8.5), sharex=True, sharey=True)
-    for i, day in tqdm(enumerate(days[:3])):
-        ax = axs[0, i%3]
+def stream_risk_days(requested_days, sse=False):
+    """NDJSON (or Server-Sent Events) response that emits one record per computed day"""
+    def generate():
+        try:
+            for day, wdf_day in iter_risk_days(requested_days):
+                record = json.dumps(risk_day_record(day, wdf_day))
+                yield f"event: day\ndata: {record}\n\n" if sse else record + "\n"
+        except Exception as e:
+            # the 200 is already sent, so the failure is reported in-band
+            app.logger.exception("Error in stream_risk_days")
+            record = json.dumps({"type": "error", "error": str(e)})
+            yield f"event: error\ndata: {record}\n\n" if sse else record + "\n"
+            return
+        if sse:
+            yield "event: done\ndata: {}\n\n"
+
+    mimetype = STREAM_MIMETYPES["sse" if sse else "ndjson"]
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
-        wdf_day = wdf_days[i] # wdf_day is already computed and scaled above
-        df_day = df.loc[(df["date"] >= day-5) & (df["date"] <= day)]
-        vmax = 0.60
 
-        wdf_day.plot(
-            column="gp_pred",
-            cmap="viridis",
-            vmin=0.0,
-            vmax=vmax,
-            legend=False,
-            ax=ax,
-            alpha=0.5,
-        )
+def map_cache_key(pest, requested_days):
+    """Cache key / job id of a map request: identical model, days and inputs always produce the same map"""
+    file = request.files['file']
+    surface_pressure = request.form.get('surfacePressure')
+    wind_speed = request.form.get('windSpeed')
+    relative_humidity = request.form.get('relativeHumidity')
+    total_evaporation = request.form.get('totalEvaporation')
 
-        plot = wdf_day.loc[ap_within].plot(
-            column="gp_pred",
-            cmap="viridis",
-            vmin=0.0,
-            vmax=vmax,
-            legend=False,
-            ax=ax
-        )
-        ax.set_title(beauty_print_date(destandardize_date(day, reference_day)))
+    return make_key(
+        pest.version,
+        pest.geodata.get().version,
+        [int(day) for day in requested_days],
+        [surface_pressure, wind_speed, relative_humidity, total_evaporation],
+        hashlib.sha256(file.read()).hexdigest(),
+    )
+
+
+def submit_map_job(requested_days, cache_key):
+    """
+    Render the map in the job pool; the PNG lands in render_cache under `cache_key`.
+    The job state is also recorded in the render cache, so a poll that reaches another
+    server worker can answer too.
+    """
+    def store(result):
+        png, predicted_prob = result
+        render_cache.put(cache_key, png, {"predicted_prob": predicted_prob})
+
+    def failed(e):
+        render_cache.set_job_state(cache_key, "failed", error=f"{type(e).__name__}: {e}")
+
+    # recorded before submitting, so a fast job's result is never followed by a stale "pending"
+    render_cache.set_job_state(cache_key, "pending", submitted_at=time.time())
+    try:
+        job_id = pest_risk_jobs.submit(render_map_job, [int(day) for day in requested_days],
+                                       job_id=cache_key, on_done=store, on_error=failed)
+    except QueueFull:
+        render_cache.clear_job_state(cache_key)
+        raise
+    if pest_risk_jobs.status(job_id)["status"] == "done":
+        # an earlier job for the same map, whose result is already stored
+        render_cache.clear_job_state(cache_key)
+    return job_id
 
-        if i%3 == 0:
-            ax.set_ylabel("latitude")
 
-        ax = axs[1, i%3]
-        cmap2 = "plasma"
+def map_response_data(png, predicted_prob):
+    img_base64 = base64.b64encode(png).decode("utf-8")
 
-        wdf_day["individual_evpi"] = evppi(
-                wdf_day["gp_pred"],                     # probability of pest occurence
-                e_c_loss_treatment,         # expected cost of yield loss given treatment
-                e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-                e_c_treatment_treatment,    # expected cost of treatment given treatment
-        )
+    # Prepare response data and convert NumPy types to Python native types
+    response_data = {
+        "predicted_prob": predicted_prob,
+        "graph": f"data:image/png;base64,{img_base64}"
+    }
 
-        vmin2 = wdf_day.individual_evpi.min()
-        vmax2 = wdf_day.individual_evpi.max()
-
-        wdf_day.plot(
-            column="individual_evpi",
-            cmap=cmap2,
-            vmin=vmin2,
-            vmax=vmax2,
-            legend=False,
-            ax=ax,
-            alpha=0.5,
-        )
+    # Convert any NumPy data types to JSON-serializable types
+    return convert_numpy_types(response_data)
 
-        wdf_day.loc[ap_within].plot(
-            column="individual_evpi",
-            cmap=cmap2,
-            vmin=vmin2,
-            vmax=vmax2,
-            legend=False,
-            ax=ax
-        )
-        if i%3 == 0:
-            ax.set_ylabel("latitude")
 
-        ax = axs[2, i%3]
+@app.route('/predict', methods=['POST'])
+def model2():
+    try:
+        requested_days = parse_days(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    pest = pest_risk.get(SUBSYSTEM_WAIT_SECONDS)
+
+    # per-day results as they are computed, without the figure
+    stream = stream_format(("ndjson", "sse"))
+    if stream is not None:
+        return stream_risk_days(requested_days, sse=stream == "sse")
+
+    if len(requested_days) > MAX_MAP_DAYS:
+        return jsonify({'error': f"The map covers at most {MAX_MAP_DAYS} days, use stream=ndjson or /predict/data for longer ranges"}), 400
+
+    cache_key = map_cache_key(pest, requested_days)
+    etag = f'"{cache_key}"'
+    if cache_key in request.if_none_match and cache_key in render_cache:
+        response = app.response_class(status=304)
+        response.headers["ETag"] = etag
+        return response
 
-        cmap3 = matplotlib.colors.ListedColormap(['#3449d1', '#f08800', '#a8006d'])
+    cached = render_cache.get(cache_key)
+    if cached is not None:
+        png, meta = cached
+        predicted_prob = meta["predicted_prob"]
+    else:
+        # rendered in a worker process, so the GP pass and the figure do not hold this process's GIL
+        job_id = submit_map_job(requested_days, cache_key)
+        try:
+            png, predicted_prob = pest_risk_jobs.wait(job_id, pest_risk_job_timeout)
+        except TimeoutError:
+            response = jsonify({"error": f"The map was not rendered within {pest_risk_job_timeout:g}s, poll the job for it",
+                                "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+            response.status_code = 504
+            response.headers["Retry-After"] = "10"
+            return response
+        except BrokenExecutor as e:
+            # a render process died; the pool is recreated on the next submit
+            response = jsonify({"error": f"The render worker crashed, try again: {e}"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+
+    response = jsonify(map_response_data(png, predicted_prob))
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
-        e_u = np.empty((len(wdf_day), 3))
-        e_u[:, 0] = e_u_gamma(
-            wdf_day["gp_pred"],                     # probability of pest occurence
-            0
-        )
-        e_u[:, 1] = e_u_gamma(
-            wdf_day["gp_pred"],                     # probability of pest occurence
-            1
-        )
-        e_u[:, 2] = e_u_gamma(
-            wdf_day["gp_pred"],                     # probability of pest occurence
-            2
-        )
 
-        suggestion_names = np.array(["inaction", "monitoring", "spraying"])
-        wdf_day["suggestion"] = np.argmax(e_u, axis=1)
+@app.route('/jobs/pest-risk', methods=['POST'])
+def submit_pest_risk_job():
+    """Queue a risk map render (same form as /predict) and answer 202 with a job id to poll"""
+    try:
+        requested_days = parse_days(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(requested_days) > MAX_MAP_DAYS:
+        return jsonify({'error': f"The map covers at most {MAX_MAP_DAYS} days, use /predict/data for longer ranges"}), 400
+    pest = pest_risk.get(SUBSYSTEM_WAIT_SECONDS)
+
+    cache_key = map_cache_key(pest, requested_days)
+    status_url = f"/jobs/{cache_key}"
+    if cache_key in render_cache:
+        return jsonify({"job_id": cache_key, "status": "done", "status_url": status_url}), 200
+    state = render_cache.job_state(cache_key, max_age=pest_risk_job_ttl)
+    if state is not None and state["status"] == "pending" and pest_risk_jobs.status(cache_key) is None:
+        # already being rendered by another server worker
+        response = jsonify({"job_id": cache_key, "status": "pending", "status_url": status_url})
+        response.status_code = 202
+        response.headers["Location"] = status_url
+        return response
 
-        vmin3 = wdf_day.individual_evpi.min()
-        vmax3 = wdf_day.individual_evpi.max()
+    job_id = submit_map_job(requested_days, cache_key)
+    response = jsonify({"job_id": job_id, "status": pest_risk_jobs.status(job_id)["status"], "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
 
-        wdf_day.plot(
-            column="suggestion",
-            cmap=cmap3,
-            legend=False,
-            ax=ax,
-            alpha=0.5,
-        )
 
-        wdf_day.loc[ap_within].plot(
-            column="suggestion",
-            cmap=cmap3,
-            legend=False,
-            ax=ax
-        )
+@app.route('/jobs/<job_id>', methods=['GET'])
+def pest_risk_job_status(job_id):
+    """Status of a map job; once done, the same payload as /predict"""
+    status = pest_risk_jobs.status(job_id)
+    if status is None:
+        # finished earlier, or submitted to another server worker sharing the render cache
+        cached = render_cache.get(job_id)
+        if cached is not None:
+            png, meta = cached
+            return jsonify({"job_id": job_id, "status": "done", **map_response_data(png, meta["predicted_prob"])})
+        state = render_cache.job_state(job_id, max_age=pest_risk_job_ttl)
+        if state is None:
+            return jsonify({"error": f"Unknown job {job_id}"}), 404
+        body = {"job_id": job_id, "status": state["status"], "submitted_at": state.get("submitted_at")}
+        if state["status"] == "failed":
+            body["error"] = state.get("error")
+        return jsonify(body)
+
+    body = {"job_id": job_id, "status": status["status"],
+            "submitted_at": status["submitted_at"], "finished_at": status["finished_at"]}
+    if status["status"] == "done":
+        png, predicted_prob = status["result"]
+        body.update(map_response_data(png, predicted_prob))
+    elif status["status"] == "failed":
+        body["error"] = status["error"]
+    return jsonify(body)
+
+@app.route('/predict/data', methods=['GET', 'POST'])
+def predict_data():
+    """Per-cell gp_pred / individual_evpi / suggestion for every day, as .npz or Arrow IPC"""
+    from risk_payload import encode_risk_chunks, PAYLOAD_FORMATS
+
+    fmt = request.values.get('format', 'npz')
+    compress = request.values.get('compress', '1') not in ('0', 'false')
+    if fmt not in PAYLOAD_FORMATS:
+        return jsonify({'error': f"format must be one of {sorted(PAYLOAD_FORMATS)}"}), 400
+    try:
+        requested_days = parse_days(request.values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    pest = pest_risk.get(SUBSYSTEM_WAIT_SECONDS)
+
+    etag = '"%s"' % make_key(
+        "data",
+        pest.version,
+        pest.geodata.get().version,
+        [int(day) for day in requested_days],
+        fmt,
+        compress,
+    )
+    if etag.strip('"') in request.if_none_match:
+        response = app.response_class(status=304)
+        response.headers["ETag"] = etag
+        return response
 
-        ax.set_xlabel("longitude")
-        if i%3 == 0:
-            ax.set_ylabel("latitude")
-
-    cbar_ax = fig.add_axes([0.78, 0.70, 0.02, 0.25])
-    sm = plt.cm.ScalarMappable(cmap='viridis', norm=plt.Normalize(vmin=0, vmax=vmax))
-    cbar = fig.colorbar(sm, cax=cbar_ax)
-    cbar.set_label(r"predicted presence probability $p_\alpha$")
-
-    cbar_ax = fig.add_axes([0.78, 0.386, 0.02, 0.25])
-    sm = plt.cm.ScalarMappable(cmap=cmap2, norm=plt.Normalize(vmin=0, vmax=vmax2))
-    cbar = fig.colorbar(sm, cax=cbar_ax)
-    cbar.set_label(r"individual EVPPI ($\text{INR}\cdot\text{ha}^{-1} \cdot\text{a}^{-1}$)")
-
-    cbar_ax = fig.add_axes([0.78, 0.078, 0.02, 0.25])
-    sm = plt.cm.ScalarMappable(cmap=cmap3)
-    cbar = fig.colorbar(sm, cax=cbar_ax, ticks=[0.22, 0.62, 0.96])
-    cbar.ax.set_yticklabels(suggestion_names)
-    for label in cbar.ax.get_yticklabels():
-        label.set_rotation(90)  # Rotate the tick labels by 45 degrees
-    cbar.set_label(r"decision recommendation")
-
-    plt.tight_layout(rect=[0, 0, 0.8, 1])
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    file_path = os.path.join("uploads", "plot.png")  # you can customize the filename
-    plt.savefig(file_path, format="png", bbox_inches="tight")
-    buf.close()
-    plt.close(fig)
+    # computed a few days at a time, so a year-long range never holds every day's weather frame
+    payload, mimetype = encode_risk_chunks(iter_risk_chunks(requested_days), fmt, compress)
 
-    # Prepare response data and convert NumPy types to Python native types
-    response_data = {
-        "predicted_prob": predicted_prob,
-        "graph": f"data:image/png;base64,{img_base64}"
-    }
-    
-    # Convert any NumPy data types to JSON-serializable types
-    response_data = convert_numpy_types(response_data)
-    
-    return jsonify(response_data)
+    response = app.response_class(payload, mimetype=mimetype)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Content-Disposition"] = f"attachment; filename=pest_risk.{fmt}"
+    return response
 
 @app.route("/predict_dual_stream", methods=["POST", "OPTIONS"])
 def predict():
@@ -534,32 +678,32 @@ def predict():
         response.headers.add('Access-Control-Allow-Methods', 'POST')
         return response
 
+    ds = dual_stream.get(SUBSYSTEM_WAIT_SECONDS)
     try:
         hsi_file = request.files.get("hsi")
         rgb_file = request.files.get("rgb")
         label_file = request.files.get("label")  # optional
 
         if hsi_file is None or rgb_file is None:
-            return jsonify({"error": "Please upload HSI (.pt) and RGB (.pt) files"}), 400
+            return jsonify({"error": "Please upload an HSI tensor (.safetensors, .npy or .pt) and an RGB tensor or JPEG/PNG image"}), 400
 
         # Add debugging
         print(f"Received files: HSI={hsi_file.filename}, RGB={rgb_file.filename}")
 
-        hsi_tensor = torch.load(hsi_file, map_location=device).unsqueeze(0).to(device)
-        rgb_tensor = torch.load(rgb_file, map_location=device).unsqueeze(0).to(device)
+        hsi_tensor = load_upload(hsi_file, HSI_SHAPE, "hsi", device).unsqueeze(0).to(device)
+        rgb_tensor = load_upload(rgb_file, RGB_SHAPE, "rgb", device).unsqueeze(0).to(device)
 
         print(f"Tensor shapes: HSI={hsi_tensor.shape}, RGB={rgb_tensor.shape}")
 
-        with torch.no_grad():
-            outputs = dual_stream_model(hsi_tensor, rgb_tensor)
-            _, predicted_label_idx = torch.max(outputs, 1)
+        outputs = ds.batcher.submit(hsi_tensor, rgb_tensor)
+        _, predicted_label_idx = torch.max(outputs, 1)
 
         predicted_class_name = class_names[predicted_label_idx.item()]
 
         # true label if provided
         true_class_name = None
         if label_file:
-            true_label_idx = torch.load(label_file, map_location=device).item()
+            true_label_idx = parse_label(read_upload(label_file.stream), device)
             true_class_name = class_names[true_label_idx]
 
         result = {
@@ -569,8 +713,27 @@ def predict():
         }
 
         print(f"Prediction result: {result}")
-        return jsonify(result)
 
+        # optional overlay from the same forward pass: ?annotate=multipart|inline&image_format=png|jpeg|webp
+        annotate = request.values.get("annotate", "").lower()
+        if annotate in ("", "0", "false", "no"):
+            return jsonify(result)
+
+        image_bytes, image_mimetype = encode_image(
+            annotate_rgb(rgb_tensor, predicted_class_name, true_class_name),
+            request.values.get("image_format", "png").lower(),
+        )
+        if annotate == "inline":
+            img_base64 = base64.b64encode(image_bytes).decode("utf-8")
+            result["image"] = f"data:{image_mimetype};base64,{img_base64}"
+            return jsonify(result)
+
+        body, content_type = multipart_result(result, image_bytes, image_mimetype)
+        return app.response_class(body, content_type=content_type)
+
+    except ValueError as e:
+        print(f"Rejected input in predict: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in predict: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -586,77 +749,198 @@ def predict_image():
         response.headers.add('Access-Control-Allow-Methods', 'POST')
         return response
 
+    ds = dual_stream.get(SUBSYSTEM_WAIT_SECONDS)
     try:
         hsi_file = request.files.get("hsi")
         rgb_file = request.files.get("rgb")
         label_file = request.files.get("label")  # optional
 
         if hsi_file is None or rgb_file is None:
-            return jsonify({"error": "Please upload HSI (.pt) and RGB (.pt) files"}), 400
+            return jsonify({"error": "Please upload an HSI tensor (.safetensors, .npy or .pt) and an RGB tensor or JPEG/PNG image"}), 400
 
-        hsi_tensor = torch.load(hsi_file, map_location=device).unsqueeze(0).to(device)
-        rgb_tensor = torch.load(rgb_file, map_location=device).unsqueeze(0).to(device)
+        hsi_tensor = load_upload(hsi_file, HSI_SHAPE, "hsi", device).unsqueeze(0).to(device)
+        rgb_tensor = load_upload(rgb_file, RGB_SHAPE, "rgb", device).unsqueeze(0).to(device)
 
-        with torch.no_grad():
-            outputs = dual_stream_model(hsi_tensor, rgb_tensor)
-            _, predicted_label_idx = torch.max(outputs, 1)
+        outputs = ds.batcher.submit(hsi_tensor, rgb_tensor)
+        _, predicted_label_idx = torch.max(outputs, 1)
 
         predicted_class_name = class_names[predicted_label_idx.item()]
 
         # true label if provided
         true_class_name = None
         if label_file:
-            true_label_idx = torch.load(label_file, map_location=device).item()
+            true_label_idx = parse_label(read_upload(label_file.stream), device)
             true_class_name = class_names[true_label_idx]
 
-        # ---- Convert RGB tensor back to image ----
-        mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1).to(device)
-        std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1).to(device)
-        rgb_img_tensor_unnormalized = rgb_tensor.squeeze(0) * std + mean
-        rgb_img_pil = T.ToPILImage()(rgb_img_tensor_unnormalized.cpu())
+        image_bytes, image_mimetype = encode_image(
+            annotate_rgb(rgb_tensor, predicted_class_name, true_class_name),
+            request.values.get("image_format", "png").lower(),
+        )
+        return send_file(io.BytesIO(image_bytes), mimetype=image_mimetype)
 
-        # ---- Draw text ----
-        draw = ImageDraw.Draw(rgb_img_pil)
-        try:
-            # Try to use a better font
-            font = ImageFont.truetype("arial.ttf", 16)
-        except:
-            font = ImageFont.load_default()
-        
-        y_offset = 10
+    except ValueError as e:
+        print(f"Rejected input in predict_image: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in predict_image: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # predicted label
-        draw.text((10, y_offset), f"Predicted: {predicted_class_name}",
-                  fill=(255, 255, 255), font=font)
-        y_offset += 25
 
-        # true label if available
-        if true_class_name:
-            draw.text((10, y_offset), f"True: {true_class_name}",
-                      fill=(0, 255, 0), font=font)
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 16))
+# survey archives up to this size are kept in memory while streaming, larger ones go to a temp file
+BULK_SPOOL_BYTES = int(os.environ.get("BULK_SPOOL_MB", 64)) * 1024 * 1024
+# incomplete tar patches held while waiting for their pair, i.e. at most this many HSI cubes
+BULK_MAX_PENDING = int(os.environ.get("BULK_MAX_PENDING", 16))
+
+
+def _decode_bulk_images(batch):
+    # JPEG / PNG members are decoded together in the preprocessing pool, then normalized in one pass
+    encoded = [patch for patch in batch if isinstance(patch["rgb"], bytes)]
+    if not encoded:
+        return batch, []
+
+    decoded = decode_images([patch["rgb"] for patch in encoded], RGB_SHAPE[-1])
+    ok = [(patch, image) for patch, image in zip(encoded, decoded) if not isinstance(image, Exception)]
+    failed = [{"id": patch["id"], "error": f"Could not decode RGB image: {image}"}
+              for patch, image in zip(encoded, decoded) if isinstance(image, Exception)]
+    if ok:
+        for (patch, _), rgb in zip(ok, normalize_images(np.stack([image for _, image in ok]))):
+            patch["rgb"] = rgb
+    bad_ids = {record["id"] for record in failed}
+    return [patch for patch in batch if patch["id"] not in bad_ids], failed
+
+
+def _predict_bulk_batch(ds, batch):
+    batch, failed = _decode_bulk_images(batch)
+    yield from failed
+    if not batch:
+        return
+
+    hsi = torch.stack([patch["hsi"] for patch in batch]).to(device)
+    rgb = torch.stack([patch["rgb"] for patch in batch]).to(device)
+    probabilities = torch.softmax(run_dual_stream(ds, hsi, rgb), dim=1)
+
+    for patch, probs in zip(batch, probabilities):
+        predicted_label_idx = int(torch.argmax(probs).item())
+        yield {
+            "id": patch["id"],
+            "predicted_label": predicted_label_idx,
+            "predicted_class": class_names[predicted_label_idx],
+            "probabilities": [round(float(p), 6) for p in probs],
+            "true_class": class_names[patch["label"]] if patch.get("label") is not None else None,
+        }
 
-        # ---- Save to memory ----
-        img_io = io.BytesIO()
-        rgb_img_pil.save(img_io, "PNG")
-        img_io.seek(0)
 
-        return send_file(img_io, mimetype="image/png")
+def iter_bulk_predictions(ds, patches, batch_size=BULK_BATCH_SIZE):
+    """Run survey patches through the model in fixed-size batches, one record per patch"""
+    batch = []
+    for patch in patches:
+        if "error" in patch:
+            yield patch
+            continue
+        try:
+            if isinstance(patch["hsi"], bytes):
+                raise ValueError("hsi must be a tensor file, images are only accepted for rgb")
+            patch["hsi"] = as_input(patch["hsi"], HSI_SHAPE, "hsi")
+            if not isinstance(patch["rgb"], bytes):
+                patch["rgb"] = as_input(patch["rgb"], RGB_SHAPE, "rgb")
+        except ValueError as e:
+            yield {"id": patch["id"], "error": str(e)}
+            continue
+
+        batch.append(patch)
+        if len(batch) == batch_size:
+            yield from _predict_bulk_batch(ds, batch)
+            batch = []
+    if batch:
+        yield from _predict_bulk_batch(ds, batch)
+
+
+@app.route("/predict_dual_stream/bulk", methods=["POST"])
+def predict_dual_stream_bulk():
+    """
+    Whole-survey inference: an `archive` (.npz with stacked hsi/rgb arrays, or a tar of
+    `<id>.hsi.*` / `<id>.rgb.*` members, optionally paired by a JSON `manifest`;
+    rgb members may be JPEG/PNG images, and a patch's members must be stored next to each
+    other), answered as NDJSON with one prediction per patch.
+    """
+    archive = request.files.get("archive")
+    if archive is None:
+        return jsonify({"error": "Please upload a survey archive (.npz or .tar)"}), 400
+
+    manifest = request.form.get("manifest")
+    if manifest is None and "manifest" in request.files:
+        manifest = request.files["manifest"].read()
+    try:
+        batch_size = max(1, min(int(request.form.get("batch_size", BULK_BATCH_SIZE)), 64))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+    ds = dual_stream.get(SUBSYSTEM_WAIT_SECONDS)
+
+    # the upload is closed once this view returns, before the response body is generated
+    spooled = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES)
+    shutil.copyfileobj(archive.stream, spooled, 1024 * 1024)
+    spooled.seek(0)
+    filename = archive.filename or ""
+
+    def generate():
+        try:
+            patches = iter_survey(spooled, filename, manifest, device, BULK_MAX_PENDING)
+            for record in iter_bulk_predictions(ds, patches, batch_size):
+                yield json.dumps(record) + "\n"
+        except Exception as e:
+            app.logger.exception("Error in predict_dual_stream_bulk")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            spooled.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
-    except Exception as e:
-        print(f"Error in predict_image: {str(e)}")
-        return jsonify({"error": str(e)}), 500
 
+@app.route("/predict_dual_stream/stats", methods=["GET"])
+def dual_stream_stats():
+    ds = dual_stream.get(SUBSYSTEM_WAIT_SECONDS)
+    return jsonify({
+        "batcher": ds.batcher.stats(),
+        "hsi_embedding_cache": ds.embedding_cache.stats() if ds.embedding_cache is not None else None,
+    })
 
-# Health check endpoint
+
+# Health check endpoint, answers without waiting for any subsystem
 @app.route("/health", methods=["GET"])
 def health_check():
+    ds = dual_stream.peek()
+    pest = pest_risk.peek()
     return jsonify({
         "status": "healthy",
-        "dual_stream_model_loaded": "dual_stream_model" in globals(),
-        "pest_risk_model_loaded": "loaded_model" in globals(),
+        "dual_stream_model_loaded": ds is not None,
+        "pest_risk_model_loaded": pest is not None,
+        "chat_loaded": chat.ready,
+        "chat_cache": chat.peek().answer_cache.stats() if chat.ready and chat.peek().answer_cache is not None else None,
+        "chat_history": chat.peek().history.stats() if chat.ready else None,
+        "render_cache": render_cache.stats(),
+        "pest_risk_jobs": pest_risk_jobs.stats(),
+        "dual_stream_batcher": ds.batcher.stats() if ds is not None else None,
+        "dual_stream_precision": ds.precision_report if ds is not None else None,
+        "dual_stream_backend": ds.backend if ds is not None else None,
+        "hsi_embedding_cache": ds.embedding_cache.stats() if ds is not None and ds.embedding_cache is not None else None,
         "device": str(device)
     })
 
 
+@app.route("/ready", methods=["GET"])
+def readiness():
+    """Load state and timing of every subsystem; 503 until all of them are ready"""
+    statuses = {name: subsystem.status() for name, subsystem in SUBSYSTEMS.items()}
+    ready = all(subsystem.ready for subsystem in SUBSYSTEMS.values())
+    return jsonify({"ready": ready, "subsystems": statuses}), 200 if ready else 503
+
+
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    # load everything in the background while the server already answers; with the debug
+    # reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        for subsystem in SUBSYSTEMS.values():
+            subsystem.start_background()
+        pest_risk_jobs.start()
+    app.run(host="0.0.0.0", port=8080, debug=True)
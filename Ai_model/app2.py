@@ -1,13 +1,16 @@
 import os
 import io
+import base64
 import torch
 import torch.nn as nn
 import torchvision.models as models
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS  # Add this import
 from timm.models import create_model
-import torchvision.transforms as T
-from PIL import Image, ImageDraw, ImageFont
+
+from backends import load_backend
+from annotate import annotate_rgb, encode_image, multipart_result
+from ingest import load_upload, parse_label, read_upload, HSI_SHAPE, RGB_SHAPE
 
 # -----------------------------
 # Model Definitions
@@ -108,6 +111,10 @@ except FileNotFoundError:
     print(f"Warning: Model file not found at {model_path}")
     print("The API will still run but predictions will fail until model is available")
 
+# eager, torchscript or onnxruntime, warmed up before the first request
+backend = os.environ.get("DUAL_STREAM_BACKEND", "eager")
+backend, inference_model = load_backend(model, backend, model_path)
+
 # -----------------------------
 # Flask App
 # -----------------------------
@@ -145,18 +152,18 @@ def predict():
         label_file = request.files.get("label")  # optional
 
         if hsi_file is None or rgb_file is None:
-            return jsonify({"error": "Please upload HSI (.pt) and RGB (.pt) files"}), 400
+            return jsonify({"error": "Please upload an HSI tensor (.safetensors, .npy or .pt) and an RGB tensor or JPEG/PNG image"}), 400
 
         # Add debugging
         print(f"Received files: HSI={hsi_file.filename}, RGB={rgb_file.filename}")
 
-        hsi_tensor = torch.load(hsi_file, map_location=device).unsqueeze(0).to(device)
-        rgb_tensor = torch.load(rgb_file, map_location=device).unsqueeze(0).to(device)
+        hsi_tensor = load_upload(hsi_file, HSI_SHAPE, "hsi", device).unsqueeze(0).to(device)
+        rgb_tensor = load_upload(rgb_file, RGB_SHAPE, "rgb", device).unsqueeze(0).to(device)
 
         print(f"Tensor shapes: HSI={hsi_tensor.shape}, RGB={rgb_tensor.shape}")
 
         with torch.no_grad():
-            outputs = model(hsi_tensor, rgb_tensor)
+            outputs = inference_model(hsi_tensor, rgb_tensor)
             _, predicted_label_idx = torch.max(outputs, 1)
 
         predicted_class_name = class_names[predicted_label_idx.item()]
@@ -164,7 +171,7 @@ def predict():
         # true label if provided
         true_class_name = None
         if label_file:
-            true_label_idx = torch.load(label_file, map_location=device).item()
+            true_label_idx = parse_label(read_upload(label_file.stream), device)
             true_class_name = class_names[true_label_idx]
 
         result = {
@@ -174,8 +181,27 @@ def predict():
         }
 
         print(f"Prediction result: {result}")
-        return jsonify(result)
 
+        # optional overlay from the same forward pass: ?annotate=multipart|inline&image_format=png|jpeg|webp
+        annotate = request.values.get("annotate", "").lower()
+        if annotate in ("", "0", "false", "no"):
+            return jsonify(result)
+
+        image_bytes, image_mimetype = encode_image(
+            annotate_rgb(rgb_tensor, predicted_class_name, true_class_name),
+            request.values.get("image_format", "png").lower(),
+        )
+        if annotate == "inline":
+            img_base64 = base64.b64encode(image_bytes).decode("utf-8")
+            result["image"] = f"data:{image_mimetype};base64,{img_base64}"
+            return jsonify(result)
+
+        body, content_type = multipart_result(result, image_bytes, image_mimetype)
+        return app.response_class(body, content_type=content_type)
+
+    except ValueError as e:
+        print(f"Rejected input in predict: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in predict: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -197,13 +223,13 @@ def predict_image():
         label_file = request.files.get("label")  # optional
 
         if hsi_file is None or rgb_file is None:
-            return jsonify({"error": "Please upload HSI (.pt) and RGB (.pt) files"}), 400
+            return jsonify({"error": "Please upload an HSI tensor (.safetensors, .npy or .pt) and an RGB tensor or JPEG/PNG image"}), 400
 
-        hsi_tensor = torch.load(hsi_file, map_location=device).unsqueeze(0).to(device)
-        rgb_tensor = torch.load(rgb_file, map_location=device).unsqueeze(0).to(device)
+        hsi_tensor = load_upload(hsi_file, HSI_SHAPE, "hsi", device).unsqueeze(0).to(device)
+        rgb_tensor = load_upload(rgb_file, RGB_SHAPE, "rgb", device).unsqueeze(0).to(device)
 
         with torch.no_grad():
-            outputs = model(hsi_tensor, rgb_tensor)
+            outputs = inference_model(hsi_tensor, rgb_tensor)
             _, predicted_label_idx = torch.max(outputs, 1)
 
         predicted_class_name = class_names[predicted_label_idx.item()]
@@ -211,42 +237,18 @@ def predict_image():
         # true label if provided
         true_class_name = None
         if label_file:
-            true_label_idx = torch.load(label_file, map_location=device).item()
+            true_label_idx = parse_label(read_upload(label_file.stream), device)
             true_class_name = class_names[true_label_idx]
 
-        # ---- Convert RGB tensor back to image ----
-        mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1).to(device)
-        std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1).to(device)
-        rgb_img_tensor_unnormalized = rgb_tensor.squeeze(0) * std + mean
-        rgb_img_pil = T.ToPILImage()(rgb_img_tensor_unnormalized.cpu())
-
-        # ---- Draw text ----
-        draw = ImageDraw.Draw(rgb_img_pil)
-        try:
-            # Try to use a better font
-            font = ImageFont.truetype("arial.ttf", 16)
-        except:
-            font = ImageFont.load_default()
-        
-        y_offset = 10
-
-        # predicted label
-        draw.text((10, y_offset), f"Predicted: {predicted_class_name}",
-                  fill=(255, 255, 255), font=font)
-        y_offset += 25
-
-        # true label if available
-        if true_class_name:
-            draw.text((10, y_offset), f"True: {true_class_name}",
-                      fill=(0, 255, 0), font=font)
-
-        # ---- Save to memory ----
-        img_io = io.BytesIO()
-        rgb_img_pil.save(img_io, "PNG")
-        img_io.seek(0)
-
-        return send_file(img_io, mimetype="image/png")
+        image_bytes, image_mimetype = encode_image(
+            annotate_rgb(rgb_tensor, predicted_class_name, true_class_name),
+            request.values.get("image_format", "png").lower(),
+        )
+        return send_file(io.BytesIO(image_bytes), mimetype=image_mimetype)
 
+    except ValueError as e:
+        print(f"Rejected input in predict_image: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in predict_image: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -258,6 +260,7 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "model_loaded": "model" in globals(),
+        "backend": backend,
         "device": str(device)
     })
 
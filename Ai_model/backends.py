@@ -0,0 +1,113 @@
+import os
+import time
+
+import torch
+
+from ingest import HSI_SHAPE, RGB_SHAPE
+
+# -----------------------------
+# Compiled inference backends for DualStreamFusionModel
+# -----------------------------
+
+BACKENDS = ("eager", "torchscript", "onnxruntime")
+
+
+def example_inputs(batch_size=1):
+    return torch.zeros((batch_size,) + HSI_SHAPE), torch.zeros((batch_size,) + RGB_SHAPE)
+
+
+def _is_stale(artifact_path, source_path):
+    if not os.path.exists(artifact_path):
+        return True
+    return os.path.exists(source_path) and os.path.getmtime(artifact_path) < os.path.getmtime(source_path)
+
+
+def export_torchscript(model, path):
+    """Trace the model (AHAM attention included) into a frozen TorchScript module"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_inputs())
+        traced = torch.jit.freeze(traced)
+    traced.save(path)
+    print(f"Exported TorchScript model to {path}")
+
+
+def export_onnx(model, path, opset_version=18):
+    """Export the model to ONNX with a dynamic batch dimension"""
+    with torch.no_grad():
+        torch.onnx.export(
+            model.eval(),
+            example_inputs(),
+            path,
+            input_names=["hsi", "rgb"],
+            output_names=["logits"],
+            dynamic_axes={"hsi": {0: "batch"}, "rgb": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset_version,
+        )
+    print(f"Exported ONNX model to {path}")
+
+
+class OnnxRuntimeModel:
+    """Callable with the same (hsi, rgb) -> logits interface as the PyTorch model"""
+
+    def __init__(self, path, intra_op_threads=None):
+        self.path = path
+        self.reset(intra_op_threads)
+
+    def reset(self, intra_op_threads=None):
+        """(Re)create the session, e.g. in a forked worker where the parent's thread pool is gone"""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, hsi, rgb):
+        logits = self.session.run(None, {
+            "hsi": hsi.detach().cpu().float().numpy(),
+            "rgb": rgb.detach().cpu().float().numpy(),
+        })[0]
+        return torch.from_numpy(logits)
+
+
+def warmup(runner, batch_sizes=(1,), iterations=2):
+    """Run a few dummy batches so graph optimization happens before the first request"""
+    started = time.perf_counter()
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            hsi, rgb = example_inputs(batch_size)
+            for _ in range(iterations):
+                runner(hsi, rgb)
+    print(f"Warmup finished in {time.perf_counter() - started:.2f}s")
+
+
+def load_backend(model, backend, weights_path, tag="fp32", warmup_batch_sizes=(1,)):
+    """
+    Return (backend, runner): the backend actually in use and a callable (hsi, rgb) -> logits.
+    Exported artifacts live next to `weights_path` and are re-exported whenever the weights
+    are newer. Any export or load failure falls back to the eager model, reported as "eager".
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+    base_path = os.path.splitext(weights_path)[0]
+    runner = model
+    try:
+        if backend == "torchscript":
+            path = f"{base_path}.{tag}.ts"
+            if _is_stale(path, weights_path):
+                export_torchscript(model, path)
+            runner = torch.jit.optimize_for_inference(torch.jit.load(path, map_location="cpu"))
+        elif backend == "onnxruntime":
+            path = f"{base_path}.{tag}.onnx"
+            if _is_stale(path, weights_path):
+                export_onnx(model, path)
+            runner = OnnxRuntimeModel(path, intra_op_threads=torch.get_num_threads())
+    except Exception as e:
+        print(f"Warning: {backend} backend unavailable ({e}), using eager PyTorch")
+        backend, runner = "eager", model
+
+    print(f"DualStream inference backend: {backend}")
+    warmup(runner, warmup_batch_sizes)
+    return backend, runner
@@ -0,0 +1,115 @@
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+
+from subsystems import ProcessLocal
+
+# -----------------------------
+# Dynamic micro-batching
+# -----------------------------
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests and runs them through `fn` as one batch.
+
+    Every request passes tensors with a leading batch dimension (usually 1). Requests are
+    concatenated along dim 0 until `max_batch_size` rows are queued or `max_wait_ms` has
+    passed since the first one arrived. After one forward pass, each caller gets its own
+    slice of the output.
+    """
+
+    def __init__(self, fn, max_batch_size=8, max_wait_ms=5, name="batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._lock = threading.Lock()
+        # (queue, thread), started on first submit and again once the thread has died
+        self._worker = ProcessLocal(self._start_worker, is_valid=lambda worker: worker[1].is_alive())
+
+        self._requests = 0
+        self._batches = 0
+        self._rows = 0
+        self._batch_sizes = Counter()
+        self._wait_time = 0.0
+        self._run_time = 0.0
+
+    def _start_worker(self):
+        inbox = queue.Queue()
+        thread = threading.Thread(target=self._run, args=(inbox,), name=self.name, daemon=True)
+        thread.start()
+        return inbox, thread
+
+    def submit(self, *inputs):
+        """Queue one request and block until its slice of the batched output is ready"""
+        inbox, _ = self._worker.get()
+        future = Future()
+        inbox.put((inputs, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self, inbox):
+        first = inbox.get()
+        batch = [first]
+        rows = len(first[0][0])
+        deadline = time.perf_counter() + self.max_wait
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0][0])
+        return batch, rows
+
+    def _run(self, inbox):
+        while True:
+            batch, rows = self._collect(inbox)
+            started = time.perf_counter()
+
+            try:
+                inputs = [torch.cat(parts, dim=0) for parts in zip(*(item[0] for item in batch))]
+                outputs = self.fn(*inputs)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_inputs, future, _ in batch:
+                n = len(item_inputs[0])
+                future.set_result(outputs[offset:offset + n])
+                offset += n
+
+            finished = time.perf_counter()
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._rows += rows
+                self._batch_sizes[rows] += 1
+                self._wait_time += sum(started - enqueued for _, _, enqueued in batch)
+                self._run_time += finished - started
+
+    def stats(self):
+        worker = self._worker.peek()
+        with self._lock:
+            return {
+                "queue_depth": worker[0].qsize() if worker is not None else 0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "requests": self._requests,
+                "batches": self._batches,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "mean_queue_wait_ms": 1000 * self._wait_time / self._requests if self._requests else 0.0,
+                "mean_forward_ms": 1000 * self._run_time / self._batches if self._batches else 0.0,
+            }
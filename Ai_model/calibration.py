@@ -0,0 +1,53 @@
+import os
+import json
+import hashlib
+
+# -----------------------------
+# Cached GP calibration
+# -----------------------------
+
+CALIBRATION_TARGET_RATE = 0.11
+
+
+def file_digest(paths, chunk_size=1 << 20):
+    """sha256 over the contents of all given files, in order"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_or_compute_scaling_factor(cache_path, source_paths, predict_mean, target_rate=CALIBRATION_TARGET_RATE):
+    """
+    Return the scaling factor `target_rate / mean(prediction)` for the GP classifier.
+
+    The value is stored in `cache_path` together with a hash of the model and data files
+    it was computed from, and recomputed only when that hash changes.
+    `predict_mean` runs the (expensive) pass over the test set and returns its mean probability.
+    """
+    source_hash = file_digest(source_paths)
+
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("source_hash") == source_hash and cached.get("target_rate") == target_rate:
+            print(f"Loaded GP calibration from {cache_path}")
+            return cached["scaling_factor"], source_hash
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    scaling_factor = float(target_rate / predict_mean())
+
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "source_hash": source_hash,
+            "target_rate": target_rate,
+            "scaling_factor": scaling_factor,
+        }, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    print(f"GP calibration recomputed and saved to {cache_path}")
+
+    return scaling_factor, source_hash
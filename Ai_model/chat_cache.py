@@ -0,0 +1,146 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from subsystems import ProcessLocal
+
+# -----------------------------
+# Answer cache for repeated chat queries
+# -----------------------------
+
+
+def normalize_text(text):
+    """Lowercase, trim surrounding punctuation and collapse whitespace"""
+    text = re.sub(r"\s+", " ", str(text or "").strip().lower())
+    return text.strip(" ?!.,;:")
+
+
+def context_turns(messages, turns=4):
+    """Text of the last `turns` messages, without timestamps or images"""
+    try:
+        items = json.loads(messages) if isinstance(messages, str) else messages
+    except ValueError:
+        return [normalize_text(messages)]
+    if not isinstance(items, list):
+        return [normalize_text(messages)]
+
+    context = []
+    for item in items[-turns:] if turns else []:
+        if isinstance(item, dict):
+            context.append([normalize_text(item.get("query")), normalize_text(item.get("answer"))])
+        else:
+            context.append(normalize_text(item))
+    return context
+
+
+class ChatCache:
+    """
+    LRU + TTL cache of chat answers, bounded by `max_entries` and `max_bytes`.
+
+    With `db_path`, answers are also written to a SQLite file, so they survive restarts
+    and are shared by every worker process. Entries older than `ttl_seconds` are ignored
+    and dropped.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024, ttl_seconds=24 * 3600, db_path=None,
+                 context_turns=4):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.context_turns = context_turns
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (created, answer)
+        self._bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # a SQLite connection must not be shared across fork
+        self._db = ProcessLocal(self._connect)
+        if db_path:
+            with self._lock:
+                db = self._db.get()
+                db.execute("DELETE FROM answers WHERE created < ?", (time.time() - ttl_seconds,))
+                db.commit()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+        db.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT, created REAL)")
+        return db
+
+    def key(self, query, language, messages="[]"):
+        """sha256 over the normalized query, the language and the recent conversation"""
+        payload = json.dumps([
+            normalize_text(query),
+            normalize_text(language),
+            context_turns(messages, self.context_turns),
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _insert(self, key, created, answer):
+        # called with the lock held
+        self._bytes -= len(self._entries.pop(key, (0, ""))[1].encode("utf-8"))
+        self._entries[key] = (created, answer)
+        self._bytes += len(answer.encode("utf-8"))
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_answer) = self._entries.popitem(last=False)
+            self._bytes -= len(old_answer.encode("utf-8"))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._bytes -= len(self._entries.pop(key)[1].encode("utf-8"))
+
+            if self.db_path:
+                row = self._db.get().execute(
+                    "SELECT created, answer FROM answers WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row is not None:
+                    self._insert(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, answer):
+        if not isinstance(answer, str) or not answer:
+            return
+        created = time.time()
+        with self._lock:
+            self._insert(key, created, answer)
+            if self.db_path:
+                db = self._db.get()
+                db.execute("INSERT OR REPLACE INTO answers (key, answer, created) VALUES (?, ?, ?)",
+                           (key, answer, created))
+                db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": bool(self.db_path),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
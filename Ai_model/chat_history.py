@@ -0,0 +1,156 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# -----------------------------
+# Token-budgeted conversation history for the chat prompt
+# -----------------------------
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for the Gemini tokenizer on English text; close enough for a budget
+    return len(text) // 4 + 1
+
+
+def parse_turns(messages):
+    """
+    ["User: ...", "Assistant: ..."] lines from the client's `messages` JSON, as sent by the
+    chat page ({query, image, timestamp} and {answer, timestamp} items).
+    """
+    try:
+        items = json.loads(messages) if isinstance(messages, str) else messages
+    except ValueError:
+        return [str(messages)] if messages else []
+    if not isinstance(items, list):
+        return [str(items)]
+
+    turns = []
+    for item in items:
+        if not isinstance(item, dict):
+            turns.append(str(item))
+            continue
+        if item.get("answer"):
+            answer = item["answer"]
+            # the chat page stores the raw response body, i.e. a JSON-encoded string
+            if isinstance(answer, str) and answer.startswith('"'):
+                try:
+                    answer = json.loads(answer)
+                except ValueError:
+                    pass
+            turns.append(f"Assistant: {answer}")
+        elif item.get("query") or item.get("image"):
+            image = " [sent an image]" if item.get("image") else ""
+            turns.append(f"User: {item.get('query') or ''}{image}")
+    return turns
+
+
+def _truncate(text, max_tokens):
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+
+class HistoryManager:
+    """
+    Keeps the chat prompt's history under `budget_tokens`.
+
+    Recent turns are passed verbatim. Once they no longer fit, the oldest ones are folded
+    into a running summary by `summarize(previous_summary, turns)`. Summaries are cached by
+    a hash of the turns they cover, so a growing conversation only summarizes the newly
+    folded turns. Folding leaves the window half full, so most turns need no summary call.
+    """
+
+    def __init__(self, summarize, budget_tokens=800, summary_tokens=200, max_turn_tokens=200, cache_size=512):
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turn_tokens = max_turn_tokens
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._summaries = OrderedDict()  # hash of turns[:n] -> summary
+
+        self.summary_calls = 0
+        self.summary_hits = 0
+
+    @staticmethod
+    def _prefix_hashes(turns):
+        # hashes[n] covers turns[:n]
+        digest = hashlib.sha256()
+        hashes = [digest.hexdigest()]
+        for turn in turns:
+            digest.update(turn.encode("utf-8") + b"\0")
+            hashes.append(digest.hexdigest())
+        return hashes
+
+    def _cached(self, key):
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _store(self, key, summary):
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    def _window_start(self, turns, budget):
+        # index of the oldest turn such that turns[start:] fits in `budget`
+        used = 0
+        start = len(turns)
+        while start > 0:
+            cost = estimate_tokens(turns[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def compact(self, messages):
+        """History text for the prompt: a summary of older turns plus the recent ones"""
+        turns = [_truncate(turn, self.max_turn_tokens) for turn in parse_turns(messages)]
+        if not turns:
+            return "None"
+
+        window_budget = self.budget_tokens - self.summary_tokens
+        if self._window_start(turns, self.budget_tokens) == 0:
+            return "\n".join(turns)
+
+        # the longest already summarized prefix
+        hashes = self._prefix_hashes(turns)
+        folded, summary = 0, ""
+        for n in range(len(turns), 0, -1):
+            cached = self._cached(hashes[n])
+            if cached is not None:
+                folded, summary = n, cached
+                self.summary_hits += 1
+                break
+
+        if self._window_start(turns, window_budget) > folded:
+            # fold enough turns to leave the window half full, so the next turns fit as is
+            fold_to = max(folded, self._window_start(turns, window_budget // 2))
+            try:
+                summary = self.summarize(summary, turns[folded:fold_to])
+                self.summary_calls += 1
+                folded = fold_to
+                self._store(hashes[folded], summary)
+            except Exception as e:
+                # without a summary, drop what does not fit rather than blowing the budget
+                print(f"Could not summarize chat history: {e}")
+                folded, summary = self._window_start(turns, window_budget), ""
+
+        recent = turns[folded:]
+        if not summary:
+            return "\n".join(recent)
+        return f"Summary of the earlier conversation: {_truncate(summary, self.summary_tokens)}\n" + "\n".join(recent)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_tokens": self.budget_tokens,
+                "cached_summaries": len(self._summaries),
+                "summary_calls": self.summary_calls,
+                "summary_hits": self.summary_hits,
+            }
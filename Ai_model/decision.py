@@ -0,0 +1,142 @@
+from collections import namedtuple
+
+import numpy as np
+
+# -----------------------------
+# Pest treatment decision costs (kept free of the chat dependencies)
+# -----------------------------
+
+e_c_loss_treatment = 0                                        
+e_c_loss_no_treatment = 868                                   
+e_c_treatment_application = 795                                 
+e_c_monitoring = 48                                          
+e_c_treatment_treatment = e_c_treatment_application/10 - 24 
+
+def expected_cost(
+    p_pest,                     # probability of pest occurence
+    treatment,                  # treatment indicator (decision variable)
+    e_c_loss_treatment,         # expected cost of yield loss given treatment
+    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
+    e_c_treatment_treatment,    # expected cost of treatment given treatment
+):
+    e_c_loss_pest = treatment * e_c_loss_treatment \
+             + (1-treatment) * e_c_loss_no_treatment
+    e_c_loss = p_pest * e_c_loss_pest
+
+    e_c_treatment = treatment * e_c_treatment_treatment
+    return e_c_loss + e_c_treatment
+
+
+def expected_hat_cost(
+    p_pest,                     # probability of pest occurence
+    treatment,                  # treatment indicator (decision variable)
+    e_c_loss_treatment,         # expected cost of yield loss given treatment
+    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
+    e_c_treatment_treatment,    # expected cost of treatment given treatment
+):
+    e_c = expected_cost(
+        p_pest,
+        treatment,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    )
+
+    shift = p_pest * e_c_loss_no_treatment
+    return e_c - shift
+
+def e_c_hat_given_no_ppi(
+    p_pest,                     # probability of pest occurence
+    e_c_loss_treatment,         # expected cost of yield loss given treatment
+    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
+    e_c_treatment_treatment,    # expected cost of treatment given treatment
+):
+    e_c_treatment = expected_hat_cost(
+        p_pest,
+        1,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    )
+    e_c_no_treatment = expected_hat_cost(
+        p_pest,
+        0,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    )
+    return np.minimum(e_c_treatment, e_c_no_treatment)
+
+def e_c_hat_given_ppi(
+    p_pest,                     # probability of pest occurence
+    e_c_loss_treatment,         # expected cost of yield loss given treatment
+    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
+    e_c_treatment_treatment,    # expected cost of treatment given treatment
+):
+    return p_pest * expected_hat_cost(
+        1,
+        1,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    )
+
+def evppi(
+    p_pest,                     # probability of pest occurence
+    e_c_loss_treatment,         # expected cost of yield loss given treatment
+    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
+    e_c_treatment_treatment,    # expected cost of treatment given treatment
+):
+    return e_c_hat_given_no_ppi(
+        p_pest,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    ) - \
+    e_c_hat_given_ppi(
+        p_pest,
+        e_c_loss_treatment,
+        e_c_loss_no_treatment,
+        e_c_treatment_treatment,
+    )
+
+def e_u_gamma(p_alpha, gamma):
+    if gamma == 0:
+        return p_alpha * 0
+    elif gamma == 1:
+        return p_alpha * (e_c_loss_no_treatment - e_c_loss_treatment - e_c_treatment_treatment) - e_c_monitoring
+    elif gamma == 2:
+        return p_alpha * (e_c_loss_no_treatment - e_c_loss_treatment) - e_c_treatment_treatment
+
+
+Decision = namedtuple("Decision", ["evppi", "expected_utility", "suggestion"])
+
+def decide(
+    p_pest,                                             # pest probabilities, any shape (e.g. cells or days x cells)
+    e_c_loss_treatment=e_c_loss_treatment,              # expected cost of yield loss given treatment
+    e_c_loss_no_treatment=e_c_loss_no_treatment,        # expected cost of yield loss given no treatment
+    e_c_treatment_treatment=e_c_treatment_treatment,    # expected cost of treatment given treatment
+    e_c_monitoring=e_c_monitoring,                      # expected cost of monitoring
+):
+    """
+    Fused decision engine: EVPPI, the expected utility of every gamma and the recommended
+    gamma (0 inaction, 1 monitoring, 2 spraying) in one NumPy broadcast pass.
+    The cost arguments may be scalars or per-cell arrays broadcastable against p_pest.
+    Equivalent to `evppi(...)`, `e_u_gamma(p, 0..2)` and their argmax.
+    """
+    p = np.asarray(p_pest, dtype=np.float64)
+    avoided_loss = np.asarray(e_c_loss_no_treatment, dtype=np.float64) - e_c_loss_treatment
+    treatment = np.asarray(e_c_treatment_treatment, dtype=np.float64)
+
+    # expected_hat_cost of treating is (treatment - p * avoided_loss), of not treating 0
+    treat_gain = p * avoided_loss - treatment
+    informed_gain = p * (avoided_loss - treatment)
+    evppi_value = np.minimum(-treat_gain, 0) + informed_gain
+
+    expected_utility = np.empty(np.broadcast(p, avoided_loss, treatment, e_c_monitoring).shape + (3,))
+    expected_utility[..., 0] = 0
+    expected_utility[..., 1] = informed_gain - e_c_monitoring
+    expected_utility[..., 2] = treat_gain
+
+    return Decision(evppi_value, expected_utility, np.argmax(expected_utility, axis=-1))
+
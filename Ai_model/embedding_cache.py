@@ -0,0 +1,136 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+# -----------------------------
+# Content-hash keyed cache of frozen HSI encoder outputs
+# -----------------------------
+
+
+class EmbeddingCache:
+    """
+    LRU cache of HSI embeddings keyed by a hash of the model `version` and the input cube.
+
+    Entries live in memory up to `max_bytes`. If `spill_dir` is set, evicted entries are
+    written there as `.npy` files, up to `spill_max_bytes`, and promoted back into memory
+    on the next hit. `version` should change with the weights and the precision mode, so
+    spilled embeddings of an older model are never served; they age out of the spill LRU.
+    """
+
+    def __init__(self, version, max_bytes=64 * 1024 * 1024, spill_dir=None, spill_max_bytes=512 * 1024 * 1024):
+        self.version = version
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> tensor
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # key -> size in bytes
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            spilled = []
+            for name in os.listdir(spill_dir):
+                if name.endswith(".npy"):
+                    path = os.path.join(spill_dir, name)
+                    spilled.append((os.path.getmtime(path), name[:-len(".npy")], os.path.getsize(path)))
+            for _, key, size in sorted(spilled):
+                self._disk[key] = size
+                self._disk_bytes += size
+
+    def key(self, tensor):
+        """sha256 over the model version and the dtype, shape and raw bytes of one input cube"""
+        array = np.ascontiguousarray(tensor.detach().cpu().numpy())
+        digest = hashlib.sha256(f"{self.version}|{array.dtype}{array.shape}".encode("utf-8"))
+        digest.update(memoryview(array).cast("B"))
+        return digest.hexdigest()
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, key + ".npy")
+
+    def _spill(self, key, tensor):
+        # called with the lock held
+        path = self._spill_path(key)
+        np.save(path, tensor.numpy())
+        size = os.path.getsize(path)
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._disk_bytes += size
+        while self._disk_bytes > self.spill_max_bytes and self._disk:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            try:
+                os.remove(self._spill_path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def _insert(self, key, tensor):
+        # called with the lock held
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = tensor
+        self._memory_bytes += tensor.element_size() * tensor.nelement()
+        while self._memory_bytes > self.max_bytes and self._memory:
+            old_key, old_tensor = self._memory.popitem(last=False)
+            self._memory_bytes -= old_tensor.element_size() * old_tensor.nelement()
+            if self.spill_dir:
+                self._spill(old_key, old_tensor)
+
+    def get(self, key):
+        with self._lock:
+            tensor = self._memory.get(key)
+            if tensor is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return tensor
+
+            if key in self._disk:
+                try:
+                    tensor = torch.from_numpy(np.load(self._spill_path(key), allow_pickle=False))
+                except (FileNotFoundError, ValueError):
+                    self._disk_bytes -= self._disk.pop(key)
+                else:
+                    self._disk_bytes -= self._disk.pop(key)
+                    try:
+                        os.remove(self._spill_path(key))
+                    except FileNotFoundError:
+                        # another process sharing the spill dir, or a cleanup, got there first
+                        pass
+                    self.disk_hits += 1
+                    self._insert(key, tensor)
+                    return tensor
+
+            self.misses += 1
+            return None
+
+    def put(self, key, tensor):
+        # own copy, so a cached row does not keep its whole batch alive
+        with self._lock:
+            self._insert(key, tensor.detach().float().cpu().clone())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "version": self.version,
+                "spilled_entries": len(self._disk),
+                "spilled_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
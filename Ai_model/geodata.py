@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import namedtuple
+
+import pandas as pd
+import geopandas as gpd
+
+from weather_store import WeatherStore
+
+# -----------------------------
+# Geospatial inputs for the pest risk map
+# -----------------------------
+
+GRID_PATH = "pest_risk_decision/data/grid.geojson"
+WEATHER_PATH = "pest_risk_decision/data/total_processed.feather"
+STATES_PATH = "India-State-and-Country-Shapefile-Updated-Jan-2020/India_State_Boundary.shp"
+
+GeoData = namedtuple("GeoData", ["version", "grid", "weather", "ap_geometry", "cells", "cell_geometry"])
+
+
+def build_cell_index(grid, ap_geometry):
+    """
+    Build the cell_id -> (longitude, latitude, ap_within) table.
+    Centroids are taken in EPSG:7755 and brought back to EPSG:4326, once per grid.
+    """
+    centroids = grid.geometry.to_crs("EPSG:7755").centroid.to_crs("EPSG:4326")
+    cells = pd.DataFrame({
+        "longitude": centroids.x.values,
+        "latitude": centroids.y.values,
+        "ap_within": grid.intersects(ap_geometry).values,
+    }, index=pd.Index(grid["cell_id"].values, name="cell_id"))
+    return cells
+
+
+class GeoDataContext:
+    """
+    Holds the grid, the date-partitioned weather store and the per-cell centroid / Andhra Pradesh
+    index in memory.
+    Everything is loaded on first use and reloaded only when a source file's mtime changes.
+    """
+
+    def __init__(self, grid_path=GRID_PATH, weather_path=WEATHER_PATH, states_path=STATES_PATH,
+                 crs=4326, state_name="Andhra Pradesh"):
+        self.grid_path = grid_path
+        self.weather_path = weather_path
+        self.states_path = states_path
+        self.crs = crs
+        self.state_name = state_name
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _source_mtimes(self):
+        return tuple(os.path.getmtime(path) for path in (self.grid_path, self.weather_path, self.states_path))
+
+    def _load(self, mtimes):
+        grid = gpd.read_file(self.grid_path)
+        weather = WeatherStore(self.weather_path)
+
+        states = gpd.read_file(self.states_path)
+        states.to_crs(epsg=self.crs, inplace=True)
+        ap_geometry = states.loc[states.State_Name == self.state_name].geometry.iat[0]
+        cells = build_cell_index(grid, ap_geometry)
+        cell_geometry = grid.set_index("cell_id").geometry
+
+        print(f"Geodata loaded: {len(grid)} grid cells, {len(weather)} weather rows")
+        return GeoData(mtimes, grid, weather, ap_geometry, cells, cell_geometry)
+
+    def get(self):
+        """Return the current GeoData snapshot, (re)loading it if the sources changed."""
+        mtimes = self._source_mtimes()
+        data = self._data
+        if data is not None and data.version == mtimes:
+            return data
+
+        with self._lock:
+            if self._data is None or self._data.version != mtimes:
+                self._data = self._load(mtimes)
+            return self._data
@@ -0,0 +1,32 @@
+import numpy as np
+import torch
+
+# -----------------------------
+# Batched GP inference
+# -----------------------------
+
+GP_BATCH_SIZE = 8192
+
+
+def predict_proba(model, likelihood, X, batch_size=GP_BATCH_SIZE):
+    """Mean presence probability for every row of X, in fixed-size minibatches."""
+    model.eval()
+    likelihood.eval()
+    out = np.empty(len(X), dtype=np.float32)
+    with torch.no_grad():
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            out[start:start + len(batch)] = likelihood(model(batch)).mean.cpu().numpy()
+    return out
+
+
+def predict_proba_stacked(model, likelihood, X_list, batch_size=GP_BATCH_SIZE):
+    """
+    Stack the per-day feature tensors in X_list, run one minibatched forward pass
+    over all of them and split the probabilities back per day.
+    """
+    sizes = [len(X) for X in X_list]
+    if not sizes:
+        return []
+    probs = predict_proba(model, likelihood, torch.cat(X_list), batch_size)
+    return np.split(probs, np.cumsum(sizes)[:-1])
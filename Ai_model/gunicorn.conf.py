@@ -0,0 +1,75 @@
+import os
+import gc
+import sys
+
+import torch
+
+# -----------------------------
+# Production launch: gunicorn -c gunicorn.conf.py app:app
+#
+# The app (ViT, ResNet and GP weights, training frames, geodata) is loaded once in the
+# master and the workers are forked from it, so those pages are shared copy-on-write
+# instead of being duplicated per worker. PRELOAD_SUBSYSTEMS=0 instead starts the workers
+# right away and loads the subsystems in the background in each of them.
+# -----------------------------
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', 8080)}")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+# the app splits its per-host render pool budget across the workers
+os.environ["GUNICORN_WORKERS"] = str(workers)
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = True
+
+# split the cores between workers so N workers do not oversubscribe the CPU
+torch_threads = int(os.environ.get("TORCH_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+torch_interop_threads = int(os.environ.get("TORCH_INTEROP_THREADS", 1))
+
+# the interop pool can only be sized before any parallel work, i.e. before the app is preloaded
+torch.set_num_interop_threads(torch_interop_threads)
+torch.set_num_threads(torch_threads)
+
+
+# load every subsystem in the master (shared by all workers) rather than lazily per worker
+preload_subsystems = os.environ.get("PRELOAD_SUBSYSTEMS", "1") != "0"
+
+
+def when_ready(server):
+    app_module = sys.modules.get("app")
+    if preload_subsystems and app_module is not None:
+        from subsystems import SubsystemUnavailable
+
+        for name, subsystem in app_module.SUBSYSTEMS.items():
+            try:
+                subsystem.get()
+            except SubsystemUnavailable as e:
+                server.log.warning(f"Could not preload {name}: {e}")
+
+    # move everything loaded so far out of the collector's reach, so GC passes in the
+    # workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Preloaded app, {workers} workers x {torch_threads} torch threads "
+                    f"({torch_interop_threads} interop)")
+
+
+def post_fork(server, worker):
+    torch.set_num_threads(torch_threads)
+
+    app_module = sys.modules.get("app")
+    if app_module is None:
+        return
+    # the render pool belongs to this worker; warm it before the first map request
+    app_module.pest_risk_jobs.start()
+    if not preload_subsystems:
+        for subsystem in app_module.SUBSYSTEMS.values():
+            subsystem.start_background()
+        return
+
+    # an ONNX Runtime session does not survive fork, give each worker its own
+    from backends import OnnxRuntimeModel
+
+    dual_stream = app_module.dual_stream.peek()
+    if dual_stream is not None and isinstance(dual_stream.runner, OnnxRuntimeModel):
+        dual_stream.runner.reset(intra_op_threads=torch_threads)
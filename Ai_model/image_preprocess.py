@@ -0,0 +1,76 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+from subsystems import ProcessLocal
+
+# -----------------------------
+# Server-side decode / resize / normalize of RGB images
+# -----------------------------
+
+IMAGE_SIZE = 224
+
+# ImageNet statistics the RGB encoder was trained with, shaped for (N, 3, H, W) batches
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+PREPROCESS_WORKERS = int(os.environ.get("IMAGE_PREPROCESS_WORKERS", min(4, os.cpu_count() or 1)))
+
+_pool = ProcessLocal(lambda: ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS,
+                                                 thread_name_prefix="image-preprocess"))
+
+
+def is_image(buf):
+    """True for JPEG or PNG bytes"""
+    return bytes(buf[:3]) == JPEG_MAGIC or bytes(buf[:8]) == PNG_MAGIC
+
+
+def decode_image(buf, size=IMAGE_SIZE):
+    """JPEG / PNG bytes -> (size, size, 3) uint8 array. PIL releases the GIL while decoding"""
+    with Image.open(io.BytesIO(buf)) as image:
+        if image.format == "JPEG":
+            # let libjpeg decode at a reduced scale when the source is much larger than needed
+            image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        if image.size != (size, size):
+            image = image.resize((size, size), Image.BILINEAR)
+        return np.asarray(image)
+
+
+def normalize(batch):
+    """(N, H, W, 3) uint8 -> (N, 3, H, W) float32 normalized with the ImageNet mean/std"""
+    tensor = torch.from_numpy(batch).permute(0, 3, 1, 2).float()
+    return tensor.div_(255).sub_(IMAGENET_MEAN).div_(IMAGENET_STD)
+
+
+def decode_images(bufs, size=IMAGE_SIZE):
+    """
+    Decode several images in the thread pool.
+    Returns one entry per input: a uint8 array, or the exception raised while decoding it.
+    """
+    def decode(buf):
+        try:
+            return decode_image(buf, size)
+        except Exception as e:
+            return e
+
+    if len(bufs) == 1:
+        return [decode(bufs[0])]
+    return list(_pool.get().map(decode, bufs))
+
+
+def preprocess_images(bufs, size=IMAGE_SIZE):
+    """Decode, resize and normalize a list of images into one (N, 3, size, size) float32 batch"""
+    decoded = decode_images(bufs, size)
+    for result in decoded:
+        if isinstance(result, Exception):
+            raise ValueError(f"Could not decode RGB image: {result}")
+    return normalize(np.stack(decoded))
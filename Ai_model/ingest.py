@@ -0,0 +1,346 @@
+import io
+import os
+import math
+import json
+import pickle
+import tarfile
+import zipfile
+
+import numpy as np
+import torch
+
+from image_preprocess import is_image, preprocess_images, IMAGE_EXTENSIONS
+
+# -----------------------------
+# Tensor ingestion for uploads and survey archives
+# -----------------------------
+
+HSI_SHAPE = (100, 224, 224)
+RGB_SHAPE = (3, 224, 224)
+
+ROLES = ("hsi", "rgb", "label")
+
+NPY_MAGIC = b"\x93NUMPY"
+ZIP_MAGIC = b"PK\x03\x04"
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "U8": torch.uint8,
+}
+FLOAT_DTYPES = (torch.float64, torch.float32, torch.float16, torch.bfloat16)
+
+
+def read_upload(stream):
+    """Read an uploaded file into one writable buffer, without intermediate copies where possible"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    buf = bytearray(size)
+    readinto = getattr(stream, "readinto", None)
+    if readinto is None:
+        buf[:] = stream.read()
+        return buf
+
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = readinto(view[pos:])
+        if not n:
+            raise ValueError("Upload ended early")
+        pos += n
+    return buf
+
+
+def _parse_npy(buf):
+    # only the small header is copied, the data is viewed in place
+    header = io.BytesIO(bytes(buf[:65536 + 12]))
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not accepted")
+    offset = header.tell()
+    count = int(np.prod(shape))
+    if offset + count * dtype.itemsize > len(buf):
+        raise ValueError("Truncated .npy data")
+
+    array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+    if fortran_order:
+        array = array.reshape(shape[::-1]).T
+    else:
+        array = array.reshape(shape)
+    if not array.dtype.isnative:
+        array = array.astype(array.dtype.newbyteorder("="))
+    return torch.from_numpy(array)
+
+
+def _is_index(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _parse_safetensors(buf, role=None):
+    header_size = int.from_bytes(buf[:8], "little")
+    if header_size <= 0 or 8 + header_size > len(buf):
+        raise ValueError("Invalid safetensors header")
+    header = json.loads(bytes(buf[8:8 + header_size]))
+    if not isinstance(header, dict):
+        raise ValueError("Invalid safetensors header")
+    header.pop("__metadata__", None)
+    if not header:
+        raise ValueError("The safetensors file contains no tensors")
+
+    if role in header:
+        info = header[role]
+    elif len(header) == 1:
+        info = next(iter(header.values()))
+    else:
+        raise ValueError(f"Expected a single tensor or one named {role!r}, found {sorted(header)}")
+
+    # the header is client input: check every field before it is used to view the buffer
+    if not isinstance(info, dict) or not {"dtype", "shape", "data_offsets"} <= info.keys():
+        raise ValueError("safetensors tensor entries need dtype, shape and data_offsets")
+    dtype = SAFETENSORS_DTYPES.get(info["dtype"]) if isinstance(info["dtype"], str) else None
+    if dtype is None:
+        raise ValueError(f"Unsupported safetensors dtype {info['dtype']!r}")
+    if not isinstance(info["shape"], list) or not all(_is_index(dim) for dim in info["shape"]):
+        raise ValueError("safetensors shape must be a list of non-negative integers")
+    offsets = info["data_offsets"]
+    if not isinstance(offsets, list) or len(offsets) != 2 or not all(_is_index(offset) for offset in offsets):
+        raise ValueError("safetensors data_offsets must be two non-negative integers")
+
+    shape = tuple(info["shape"])
+    begin, end = offsets
+    count = math.prod(shape)
+    if begin > end or end - begin != count * dtype.itemsize or 8 + header_size + end > len(buf):
+        raise ValueError("safetensors data offsets do not match the tensor shape")
+    if count == 0:
+        return torch.empty(shape, dtype=dtype)
+
+    return torch.frombuffer(buf, dtype=dtype, count=count, offset=8 + header_size + begin).view(shape)
+
+
+def parse_tensor(buf, role=None, device="cpu"):
+    """
+    Decode a tensor from raw upload bytes: `.npy` and safetensors are viewed in place,
+    legacy `.pt` files are only accepted through `weights_only` loading.
+    """
+    if not isinstance(buf, bytearray):
+        buf = bytearray(buf)
+    if buf[:6] == NPY_MAGIC:
+        return _parse_npy(buf)
+    if buf[:4] == ZIP_MAGIC or buf[:1] == b"\x80":
+        try:
+            tensor = torch.load(io.BytesIO(buf), map_location=device, weights_only=True)
+        except pickle.UnpicklingError as e:
+            raise ValueError(f"Refusing to load {role or 'tensor'} file: {e}")
+        except (RuntimeError, EOFError, IndexError) as e:
+            # corrupt or truncated zip / torch archive
+            raise ValueError(f"Could not read {role or 'tensor'} file: {e}")
+        if not isinstance(tensor, torch.Tensor):
+            raise ValueError(f"The {role or 'tensor'} file does not contain a single tensor")
+        return tensor
+    if len(buf) > 8 and buf[8:9] == b"{":
+        return _parse_safetensors(buf, role)
+    raise ValueError(f"Unrecognised {role or 'tensor'} format, expected .npy, .safetensors or .pt")
+
+
+def as_input(tensor, expected, role):
+    """Validate dtype and (C, H, W) shape of a model input and return it as float32"""
+    if tensor.dtype not in FLOAT_DTYPES:
+        raise ValueError(f"{role} tensor has dtype {tensor.dtype}, expected a float tensor")
+    if tensor.dim() == len(expected) + 1 and tensor.shape[0] == 1:
+        tensor = tensor[0]
+    check_shape(tensor, expected, role)
+    return tensor.float()
+
+
+def load_upload(file_storage, expected, role, device="cpu"):
+    """
+    Validated (C, H, W) float32 model input from an uploaded .npy / .safetensors / .pt file.
+    RGB inputs may also be a JPEG or PNG, which is resized and normalized server-side.
+    """
+    buf = read_upload(file_storage.stream)
+    if role == "rgb" and is_image(buf):
+        return check_shape(preprocess_images([buf], expected[-1])[0], expected, role).to(device)
+    return as_input(parse_tensor(buf, role, device), expected, role)
+
+
+def parse_label(buf, device="cpu"):
+    """Class index from a tensor file or a plain-text integer"""
+    try:
+        return int(parse_tensor(buf, "label", device).item())
+    except ValueError:
+        return int(bytes(buf).decode("utf-8").strip())
+
+
+def load_tensor_bytes(name, data, device="cpu"):
+    """
+    Decode one member of a survey archive into a tensor. JPEG / PNG members are returned
+    as raw bytes so a whole batch of them can be decoded together.
+    """
+    if name.lower().endswith(IMAGE_EXTENSIONS):
+        return bytes(data)
+    if name.endswith(".txt"):
+        return torch.tensor(int(data.decode("utf-8").strip()))
+    if name.endswith((".npy", ".safetensors", ".pt", ".pth")):
+        role = os.path.basename(name).split(".")[-2] if name.count(".") > 1 else None
+        return parse_tensor(data, role, device)
+    raise ValueError(f"Unsupported file type for {name}")
+
+
+def check_shape(tensor, expected, role):
+    if tuple(tensor.shape) != tuple(expected):
+        raise ValueError(f"{role} tensor has shape {tuple(tensor.shape)}, expected {tuple(expected)}")
+    return tensor
+
+
+# ---------- .npz surveys ----------
+
+def _read_exact(f, n):
+    chunks = []
+    while n > 0:
+        chunk = f.read(n)
+        if not chunk:
+            raise ValueError("Truncated array in archive")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def iter_npy_rows(f, batch_rows=1):
+    """
+    Stream a stacked `.npy` array row-block by row-block without loading it whole.
+    Yields numpy arrays of at most `batch_rows` rows.
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if fortran_order or dtype.hasobject or len(shape) == 0:
+        raise ValueError("Survey arrays must be C-ordered, non-object and stacked along the first axis")
+
+    row_shape = shape[1:]
+    row_bytes = dtype.itemsize * int(np.prod(row_shape))
+    for start in range(0, shape[0], batch_rows):
+        n = min(batch_rows, shape[0] - start)
+        yield np.frombuffer(_read_exact(f, n * row_bytes), dtype=dtype).reshape((n,) + row_shape)
+
+
+def iter_npz_survey(fileobj):
+    """
+    Patches from a `.npz` with stacked `hsi` and `rgb` arrays and optional `ids` / `labels`.
+    Members are streamed one patch at a time, so memory does not grow with the survey size.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        names = set(zf.namelist())
+        if "hsi.npy" not in names or "rgb.npy" not in names:
+            raise ValueError("The .npz survey needs stacked 'hsi' and 'rgb' arrays")
+
+        ids = labels = None
+        if "ids.npy" in names:
+            with zf.open("ids.npy") as f:
+                ids = np.load(f, allow_pickle=False)
+        if "labels.npy" in names:
+            with zf.open("labels.npy") as f:
+                labels = np.load(f, allow_pickle=False)
+
+        with zf.open("hsi.npy") as hsi_f, zf.open("rgb.npy") as rgb_f:
+            for i, (hsi, rgb) in enumerate(zip(iter_npy_rows(hsi_f), iter_npy_rows(rgb_f))):
+                yield {
+                    "id": str(ids[i]) if ids is not None else str(i),
+                    "hsi": torch.from_numpy(hsi[0].copy()),
+                    "rgb": torch.from_numpy(rgb[0].copy()),
+                    "label": int(labels[i]) if labels is not None else None,
+                }
+
+
+# ---------- tar surveys ----------
+
+def _member_role(name):
+    # "<id>.hsi.npy" -> ("<id>", "hsi")
+    stem, _ = os.path.splitext(os.path.basename(name))
+    patch_id, _, role = stem.rpartition(".")
+    if role not in ROLES or not patch_id:
+        return None, None
+    return patch_id, role
+
+
+def parse_manifest(manifest):
+    """
+    Map archive member names to (patch id, role) from a manifest, given as a JSON list of
+    {"id": ..., "hsi": member, "rgb": member, "label": member (optional)}.
+    """
+    entries = json.loads(manifest) if isinstance(manifest, (str, bytes)) else manifest
+    members = {}
+    for entry in entries:
+        for role in ROLES:
+            if entry.get(role):
+                members[entry[role]] = (str(entry["id"]), role)
+    return members
+
+
+def iter_tar_survey(fileobj, manifest=None, device="cpu", max_pending=16):
+    """
+    Patches from a (optionally compressed) tar, read as a stream.
+    Members are paired by the manifest, or by the `<id>.hsi.*` / `<id>.rgb.*` /
+    `<id>.label.*` naming convention. A completed pair is held back only until a
+    member of another patch arrives, so a label stored next to its pair is picked up.
+
+    The members of a patch must be stored close together (e.g. `tar cf survey.tar
+    p1.hsi.npy p1.rgb.npy p2.hsi.npy ...`), not grouped by role: at most `max_pending`
+    incomplete patches are held, and past that the oldest one is reported as an error.
+    """
+    members = parse_manifest(manifest) if manifest else None
+    pending = {}
+    failed = set()
+
+    def flush(keep=None):
+        for patch_id in [pid for pid, parts in pending.items() if pid != keep and "hsi" in parts and "rgb" in parts]:
+            parts = pending.pop(patch_id)
+            yield {"id": patch_id, **parts}
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            patch_id, role = members.get(member.name, (None, None)) if members is not None else _member_role(member.name)
+            if role is None or patch_id in failed:
+                continue
+
+            yield from flush(keep=patch_id)
+            parts = pending.setdefault(patch_id, {"label": None})
+            try:
+                tensor = load_tensor_bytes(member.name, tar.extractfile(member).read(), device)
+                parts[role] = int(tensor.item()) if role == "label" else tensor
+            except Exception as e:
+                pending.pop(patch_id, None)
+                failed.add(patch_id)
+                yield {"id": patch_id, "error": f"{member.name}: {e}"}
+
+            # bounded memory whatever the layout: drop the oldest unpaired patches
+            while len(pending) > max_pending:
+                old_id = next(iter(pending))
+                pending.pop(old_id)
+                failed.add(old_id)
+                yield {"id": old_id, "error": f"its hsi/rgb pair did not follow within {max_pending} patches; "
+                                              f"store each patch's members next to each other in the archive"}
+
+    yield from flush()
+    for patch_id, parts in pending.items():
+        missing = [role for role in ("hsi", "rgb") if role not in parts]
+        yield {"id": patch_id, "error": f"missing {', '.join(missing)}"}
+
+
+def iter_survey(fileobj, filename, manifest=None, device="cpu", max_pending=16):
+    """Dispatch on the archive type (.npz or tar / tar.gz / tar.bz2 / tar.xz)"""
+    if filename.endswith(".npz"):
+        return iter_npz_survey(fileobj)
+    return iter_tar_survey(fileobj, manifest, device, max_pending)
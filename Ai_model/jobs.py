@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from subsystems import ProcessLocal
+
+# -----------------------------
+# Submit / poll jobs on a bounded pool of warm worker processes
+# -----------------------------
+
+
+class QueueFull(RuntimeError):
+    """Raised when `max_pending` jobs are already queued or running"""
+
+
+class JobQueue:
+    """
+    Runs module-level functions in a pool of spawned worker processes.
+
+    `initializer` runs once per worker, so workers can load their models before the first
+    job. At most `max_pending` jobs are accepted at a time, and finished jobs are forgotten
+    after `ttl_seconds`. The pool is created by `start()` or the first submit, and again in
+    a forked child or after a worker died; every worker is spawned and warmed right away.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, initializer=None, initargs=(), ttl_seconds=600,
+                 name="jobs"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.initargs = initargs
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+
+        self._lock = threading.Lock()
+        # a worker that died takes the whole pool down with it, which is then replaced
+        self._pool = ProcessLocal(self._start_pool, is_valid=lambda pool: not getattr(pool, "_broken", False))
+        self._jobs = ProcessLocal(dict)  # job id -> record, for this process's pool
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer,
+            initargs=self.initargs,
+        )
+        # spawned workers otherwise start one at a time as jobs arrive, and the first jobs
+        # would wait for their initializer; one no-op per worker spawns them all now
+        for _ in range(self.max_workers):
+            pool.submit(os.getpid)
+        return pool
+
+    def start(self):
+        """Create the pool and start warming every worker, without waiting for them"""
+        self._pool.get()
+
+    def _prune(self):
+        # called with the lock held
+        now = time.time()
+        jobs = self._jobs.get()
+        for job_id in [job_id for job_id, job in jobs.items()
+                       if job["finished_at"] is not None and now - job["finished_at"] > self.ttl_seconds]:
+            del jobs[job_id]
+
+    def submit(self, fn, *args, job_id=None, on_done=None, on_error=None):
+        """
+        Queue `fn(*args)` and return its job id. Submitting an id that is still known
+        returns it without running the job again. `on_done(result)` runs in the parent
+        once the job has succeeded, `on_error(exception)` once it has failed.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            pool = self._pool.get()
+            jobs = self._jobs.get()
+            self._prune()
+            if job_id in jobs and jobs[job_id]["error"] is None:
+                return job_id
+            pending = sum(1 for job in jobs.values() if job["finished_at"] is None)
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs are already pending, try again shortly")
+
+            job = {"submitted_at": time.time(), "finished_at": None, "result": None, "error": None,
+                   "exception": None, "done": threading.Event()}
+            job["future"] = pool.submit(fn, *args)
+            jobs[job_id] = job
+            self.submitted += 1
+
+        job["future"].add_done_callback(lambda future: self._finish(job, future, on_done, on_error))
+        return job_id
+
+    def _finish(self, job, future, on_done, on_error):
+        try:
+            result = future.result()
+            if on_done is not None:
+                on_done(result)
+        except Exception as e:
+            job["exception"] = e
+            job["error"] = f"{type(e).__name__}: {e}"
+            with self._lock:
+                self.failed += 1
+            if on_error is not None:
+                try:
+                    on_error(e)
+                except Exception as callback_error:
+                    print(f"Error in {self.name} on_error callback: {callback_error}")
+        else:
+            job["result"] = result
+            with self._lock:
+                self.completed += 1
+        job["finished_at"] = time.time()
+        job["done"].set()
+
+    def status(self, job_id):
+        """{"status": queued | running | done | failed, ...} for a known job, else None"""
+        with self._lock:
+            job = self._jobs.get().get(job_id)
+        if job is None:
+            return None
+
+        if job["finished_at"] is not None:
+            status = "failed" if job["error"] is not None else "done"
+        else:
+            status = "running" if job["future"].running() else "queued"
+        return {
+            "status": status,
+            "submitted_at": job["submitted_at"],
+            "finished_at": job["finished_at"],
+            "result": job["result"],
+            "error": job["error"],
+        }
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished and return its result (or raise its error)"""
+        with self._lock:
+            job = self._jobs.get()[job_id]
+        if not job["done"].wait(timeout):
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout}s")
+        if job["exception"] is not None:
+            raise job["exception"]
+        return job["result"]
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.get().values() if job["finished_at"] is None)
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
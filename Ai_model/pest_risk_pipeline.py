@@ -0,0 +1,255 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import torch
+from tqdm import tqdm
+
+from subsystems import Subsystem, SUBSYSTEM_WAIT_SECONDS
+from calibration import load_or_compute_scaling_factor
+from gp_inference import predict_proba, predict_proba_stacked
+from decision import decide, e_c_loss_treatment, e_c_loss_no_treatment, e_c_treatment_treatment, e_c_monitoring
+
+device = torch.device("cpu")
+
+# -----------------------------
+# Load Pest Risk Model
+# -----------------------------
+n_covars = 270
+N_INDUCING_POINTS = 24 
+
+pest_risk_model_path = 'models/pest_risk_model_state.pth'
+pest_risk_likelihood_path = 'models/pest_risk_likelihood_state.pth'
+pest_risk_calibration_path = 'models/pest_risk_calibration.json'
+pest_risk_data_path = 'pest_risk_decision/data/combined_synthetic1.feather'
+
+variables = [
+    "temperature",
+    "relative_humidity",
+    "solar_radiation",
+    "total_evaporation_sum",
+    "wind_speed",
+    "surface_pressure",
+    "precipitation",
+    "leaf_area_index_high_vegetation",
+    "leaf_area_index_low_vegetation",
+]
+
+suffixes = [""]
+
+for lag_i in range(1, 30):
+    suffixes.append(f"_l{lag_i}")
+
+vars = []
+for var in variables:
+    for suffix in suffixes:
+        vars.append(var+suffix)
+
+reference_day = pd.Timestamp("2018-01-01")
+
+location_min = np.array([12.587, 76.770])
+
+days = np.array([1461, 1551, 1704])
+
+PestRisk = namedtuple("PestRisk", [
+    "model", "likelihood", "data_preprocessor", "test_X", "scaling_factor", "version", "geodata",
+])
+
+
+def load_pest_risk():
+    # gpytorch, geopandas and the training frame are only needed for the risk map
+    import gpytorch
+    from pest_risk_decision.gp_model import GPClassificationModel
+    from pest_risk_decision.utils import DataPreprocessor
+    from geodata import GeoDataContext
+
+    placeholder_inducing_points = torch.randn(N_INDUCING_POINTS, 273).to(device)
+    loaded_model = GPClassificationModel(inducing_points=placeholder_inducing_points, n_covars=n_covars).to(device)
+    loaded_likelihood = gpytorch.likelihoods.BernoulliLikelihood().to(device)
+
+    loaded_model.load_state_dict(torch.load(pest_risk_model_path, map_location=torch.device('cpu')))
+    loaded_likelihood.load_state_dict(torch.load(pest_risk_likelihood_path, map_location=torch.device('cpu')))
+
+    loaded_model.eval()
+    loaded_likelihood.eval()
+
+    print("Pest risk model and likelihood state dictionaries loaded.")
+
+    df = pd.read_feather(pest_risk_data_path)
+    data_preprocessor = DataPreprocessor(
+        df,
+        vars,
+        "presence",
+        location_min,
+    )
+
+    X = torch.from_numpy(data_preprocessor.get_X_numpy(df)).float().contiguous().to(device)
+    test_idxs = (X[:, 2] > 1460/365) & (X[:, 2] <= 1825/365)
+    test_X = X[test_idxs, :]
+
+    # calibration only changes with the model or the data, so it is cached next to the model state
+    scaling_factor, pest_risk_model_version = load_or_compute_scaling_factor(
+        pest_risk_calibration_path,
+        [pest_risk_model_path, pest_risk_likelihood_path, pest_risk_data_path],
+        lambda: predict_proba(loaded_model, loaded_likelihood, test_X).mean(),
+    )
+
+    # grid, weather frame and AP mask are loaded once and shared across requests
+    geodata = GeoDataContext()
+    geodata.get()
+
+    return PestRisk(loaded_model, loaded_likelihood, data_preprocessor, test_X, scaling_factor,
+                    pest_risk_model_version, geodata)
+
+
+pest_risk = Subsystem("pest_risk", load_pest_risk)
+
+
+# -----------------------------
+# Pest risk map pipeline
+# -----------------------------
+
+def predict_sample_probability():
+    pest = pest_risk.get(SUBSYSTEM_WAIT_SECONDS)
+    sample_X = pest.test_X[2, :].unsqueeze(0)
+
+    with torch.no_grad():
+        pred_sample = pest.likelihood(pest.model(sample_X))
+        return pred_sample.mean.item() * pest.scaling_factor
+
+
+def compute_risk_days(days):
+    """Per-day frames with gp_pred, individual_evpi and suggestion for every grid cell"""
+    pest = pest_risk.get(SUBSYSTEM_WAIT_SECONDS)
+    geo = pest.geodata.get()
+    wdf = geo.weather
+
+    wdf_days = []
+    X_maps = []
+    for i, day in tqdm(enumerate(days)):
+        # use a particular day
+        wdf_day = wdf.day(day)
+
+        # centroids and the AP mask come from the precomputed cell index
+        wdf_day = wdf_day.join(geo.cells, on="cell_id", how="left")
+        wdf_day.dropna(inplace=True)
+        wdf_day["ap_within"] = wdf_day["ap_within"].astype(bool)
+
+        X_maps.append(torch.from_numpy(pest.data_preprocessor.get_X_numpy(wdf_day)).float().contiguous().to(device))
+        wdf_days.append(wdf_day)
+
+    # one minibatched GP pass over all requested days
+    for wdf_day, pred_map in zip(wdf_days, predict_proba_stacked(pest.model, pest.likelihood, X_maps)):
+        wdf_day["gp_pred"] = pred_map * pest.scaling_factor
+
+        decision = decide(
+            wdf_day["gp_pred"].to_numpy(),  # probability of pest occurence
+            e_c_loss_treatment,             # expected cost of yield loss given treatment
+            e_c_loss_no_treatment,          # expected cost of yield loss given no treatment
+            e_c_treatment_treatment,        # expected cost of treatment given treatment
+            e_c_monitoring,                 # expected cost of monitoring
+        )
+        wdf_day["individual_evpi"] = decision.evppi
+        wdf_day["suggestion"] = decision.suggestion
+
+    return wdf_days
+
+
+def render_risk_map(days, wdf_days):
+    """Render the probability / EVPPI / recommendation maps for `days` to PNG bytes"""
+    # matplotlib is only imported once a map is rendered
+    from risk_map import get_renderer
+    from pest_risk_decision.utils import destandardize_date, beauty_print_date
+
+    renderer = get_renderer(pest_risk.get(SUBSYSTEM_WAIT_SECONDS).geodata.get())
+    titles = [beauty_print_date(destandardize_date(day, reference_day)) for day in days]
+    return renderer.render(wdf_days, titles)
+
+
+MAX_FORECAST_DAYS = 366
+MAX_MAP_DAYS = 7
+
+
+def _parse_day(value):
+    # either a day offset from reference_day or an ISO date
+    try:
+        day = int(value)
+    except ValueError:
+        try:
+            date = pd.Timestamp(value)
+            if date.tzinfo is not None:
+                # dates are compared as naive UTC, like reference_day
+                date = date.tz_convert(None)
+            return (date - reference_day).days
+        except (TypeError, ValueError, OverflowError) as e:
+            raise ValueError(f"Invalid date {value!r}: {e}")
+    try:
+        reference_day + pd.Timedelta(days=day)
+    except (ValueError, OverflowError):
+        raise ValueError(f"Day offset {value!r} is out of range")
+    return day
+
+
+def parse_days(values):
+    """
+    Requested days from `startDate` / `endDate` (ISO dates or day offsets) and an optional
+    `stepDays`, falling back to the default `days`.
+    """
+    start = values.get('startDate')
+    if not start:
+        return days
+
+    end = values.get('endDate') or start
+    step = int(values.get('stepDays', 1))
+    start_day, end_day = _parse_day(start), _parse_day(end)
+    if step < 1 or end_day < start_day:
+        raise ValueError("endDate must not be before startDate and stepDays must be positive")
+
+    # checked before anything is allocated, so a huge range cannot exhaust memory
+    if (end_day - start_day) // step + 1 > MAX_FORECAST_DAYS:
+        raise ValueError(f"At most {MAX_FORECAST_DAYS} days can be requested at once")
+    return np.arange(start_day, end_day + 1, step)
+
+
+# days computed together by /predict/data; bounds the weather frames held at once
+DATA_CHUNK_DAYS = int(os.environ.get("RISK_DATA_CHUNK_DAYS", 8))
+
+
+def iter_risk_chunks(requested_days, chunk_days=DATA_CHUNK_DAYS):
+    """Yield (days, frames) for consecutive chunks of at most `chunk_days` days"""
+    for start in range(0, len(requested_days), chunk_days):
+        chunk = requested_days[start:start + chunk_days]
+        yield chunk, compute_risk_days(chunk)
+
+
+def iter_risk_days(requested_days):
+    """Yield (day, frame) as soon as each day has been computed"""
+    for day in requested_days:
+        yield day, compute_risk_days([day])[0]
+
+
+def risk_day_record(day, wdf_day):
+    return {
+        "day": int(day),
+        "date": (reference_day + pd.Timedelta(days=int(day))).strftime("%Y-%m-%d"),
+        "cell_id": wdf_day["cell_id"].tolist(),
+        "gp_pred": wdf_day["gp_pred"].astype(float).round(6).tolist(),
+        "individual_evpi": wdf_day["individual_evpi"].astype(float).round(4).tolist(),
+        "suggestion": wdf_day["suggestion"].astype(int).tolist(),
+    }
+
+
+# ---------- pest-risk job workers ----------
+
+def warm_worker(num_threads=1):
+    """Process pool initializer: size torch's thread pool and load the GP model and geodata"""
+    torch.set_num_threads(num_threads)
+    pest_risk.get()
+
+
+def render_map_job(requested_days):
+    """(png bytes, predicted_prob) of the risk map for `requested_days`, run in a worker process"""
+    predicted_prob = predict_sample_probability()
+    png = render_risk_map(requested_days, compute_risk_days(requested_days))
+    return png, predicted_prob
@@ -0,0 +1,118 @@
+import copy
+import contextlib
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# -----------------------------
+# Reduced-precision CPU inference with an accuracy gate
+# -----------------------------
+
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+# a mode is only enabled if it stays this close to fp32 on the reference set
+MIN_TOP1_AGREEMENT = 0.99
+MAX_LOGIT_DRIFT = 0.5
+
+
+class BF16Autocast(nn.Module):
+    """Runs the wrapped model under CPU bfloat16 autocast and returns fp32 logits"""
+
+    def __init__(self, model):
+        super(BF16Autocast, self).__init__()
+        self.model = model
+
+    def forward(self, *inputs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.model(*inputs).float()
+
+
+def unwrap_precision(model):
+    """(underlying module, context manager factory) for a model built by build_precision_model"""
+    if isinstance(model, BF16Autocast):
+        return model.model, lambda: torch.autocast("cpu", dtype=torch.bfloat16)
+    return model, contextlib.nullcontext
+
+
+def quantize_int8(model):
+    """Dynamic INT8 quantization of every Linear layer (ViT blocks, ResNet fc, AHAM, classifier head)"""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def build_precision_model(model, mode):
+    if mode == "fp32":
+        return model
+    if mode == "int8":
+        return quantize_int8(model).eval()
+    if mode == "bf16":
+        return BF16Autocast(model).eval()
+    raise ValueError(f"Unknown precision mode {mode!r}, expected one of {PRECISION_MODES}")
+
+
+def synthetic_reference_set(n=8, batch_size=4, seed=0, hsi_shape=(100, 224, 224), rgb_shape=(3, 224, 224)):
+    """Fixed-seed random inputs, used when no recorded reference set is available"""
+    generator = torch.Generator().manual_seed(seed)
+    batches = []
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        batches.append((
+            torch.randn((size,) + tuple(hsi_shape), generator=generator),
+            torch.randn((size,) + tuple(rgb_shape), generator=generator),
+        ))
+    return batches
+
+
+def load_reference_set(path, batch_size=4):
+    """Reference batches from an `.npz` with stacked `hsi` and `rgb` arrays"""
+    data = np.load(path, allow_pickle=False)
+    hsi = torch.from_numpy(data["hsi"]).float()
+    rgb = torch.from_numpy(data["rgb"]).float()
+    return [(hsi[i:i + batch_size], rgb[i:i + batch_size]) for i in range(0, len(hsi), batch_size)]
+
+
+def compare_to_fp32(reference_model, candidate_model, reference_batches):
+    """Top-1 agreement and logit drift of `candidate_model` against the fp32 model"""
+    agree = total = 0
+    max_drift = 0.0
+    drift_sum = 0.0
+    with torch.no_grad():
+        for inputs in reference_batches:
+            expected = reference_model(*inputs).float()
+            actual = candidate_model(*inputs).float()
+            drift = (actual - expected).abs()
+
+            agree += int((actual.argmax(1) == expected.argmax(1)).sum())
+            total += len(expected)
+            max_drift = max(max_drift, float(drift.max()))
+            drift_sum += float(drift.mean(1).sum())
+
+    return {
+        "top1_agreement": agree / total if total else 1.0,
+        "max_logit_drift": max_drift,
+        "mean_logit_drift": drift_sum / total if total else 0.0,
+        "samples": total,
+    }
+
+
+def select_precision(model, mode, reference_batches,
+                     min_agreement=MIN_TOP1_AGREEMENT, max_drift=MAX_LOGIT_DRIFT):
+    """
+    Return (model to serve, report). The reduced-precision model is only used if it stays
+    within tolerance of fp32 on the reference batches; otherwise the fp32 model is kept.
+    """
+    if mode == "fp32":
+        return model, {"mode": "fp32", "enabled": True}
+
+    candidate = build_precision_model(model, mode)
+    report = compare_to_fp32(model, candidate, reference_batches)
+    report["mode"] = mode
+    report["enabled"] = report["top1_agreement"] >= min_agreement and report["max_logit_drift"] <= max_drift
+
+    if report["enabled"]:
+        print(f"Using {mode} inference: {report}")
+        return candidate, report
+
+    print(f"Refusing {mode} inference, outside tolerance "
+          f"(agreement >= {min_agreement}, drift <= {max_drift}): {report}")
+    return model, report
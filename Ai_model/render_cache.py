@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# -----------------------------
+# Content-addressed cache for rendered risk maps
+# -----------------------------
+
+
+def make_key(*parts):
+    """Stable sha256 key over JSON-serializable parts (model version, days, form inputs ...)"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    LRU cache of rendered PNGs, one `<key>.png` + `<key>.json` pair per entry under `cache_dir`.
+    Entries are written atomically, and the least recently used ones are evicted once the
+    total size on disk exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, key + ".png"), os.path.join(self.cache_dir, key + ".json")
+
+    def _job_path(self, key):
+        return os.path.join(self.cache_dir, key + ".job")
+
+    def _scan(self):
+        # rebuild the LRU order from what is already on disk, oldest access first
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".png"):
+                continue
+            key = name[:-len(".png")]
+            png_path, meta_path = self._paths(key)
+            if not os.path.exists(meta_path):
+                continue
+            size = os.path.getsize(png_path) + os.path.getsize(meta_path)
+            found.append((os.path.getmtime(png_path), key, size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _adopt(self, key):
+        # called with the lock held: pick up an entry written by another process sharing cache_dir
+        if key in self._entries or not key.isalnum():
+            return key in self._entries
+        png_path, meta_path = self._paths(key)
+        try:
+            size = os.path.getsize(png_path) + os.path.getsize(meta_path)
+        except OSError:
+            return False
+        self._entries[key] = size
+        self._total_bytes += size
+        self._evict()
+        return key in self._entries
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._adopt(key)
+
+    def get(self, key):
+        """Return (png_bytes, meta) for `key`, or None on a miss."""
+        with self._lock:
+            if not self._adopt(key):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        png_path, meta_path = self._paths(key)
+        try:
+            with open(png_path, "rb") as f:
+                png = f.read()
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(png_path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        return png, meta
+
+    def set_job_state(self, key, status, **fields):
+        """
+        Record the state of the job rendering `key` next to the cache, so every process
+        sharing `cache_dir` can report it, not only the one that owns the job.
+        """
+        if not key.isalnum():
+            raise ValueError(f"Invalid cache key {key!r}")
+        path = self._job_path(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(path + suffix, "w") as f:
+            json.dump({"status": status, "updated_at": time.time(), **fields}, f)
+        os.replace(path + suffix, path)
+
+    def job_state(self, key, max_age=None):
+        """The last recorded job state for `key`, or None; states older than `max_age` are dropped"""
+        if not key.isalnum():
+            return None
+        path = self._job_path(key)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if max_age is not None and time.time() - state.get("updated_at", 0) > max_age:
+            # the process that owned the job is gone, or the failure is old news
+            self.clear_job_state(key)
+            return None
+        return state
+
+    def clear_job_state(self, key):
+        try:
+            os.remove(self._job_path(key))
+        except FileNotFoundError:
+            pass
+
+    def put(self, key, png, meta):
+        png_path, meta_path = self._paths(key)
+        meta_bytes = json.dumps(meta).encode("utf-8")
+
+        # per-key temp files, so concurrent renders of the same key never see a partial file
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        for path, data in ((meta_path, meta_bytes), (png_path, png)):
+            with open(path + suffix, "wb") as f:
+                f.write(data)
+            os.replace(path + suffix, path)
+        self.clear_job_state(key)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(png) + len(meta_bytes)
+            self._total_bytes += len(png) + len(meta_bytes)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,194 @@
+import io
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import PathCollection
+from matplotlib.colors import Normalize, ListedColormap
+from matplotlib.transforms import Bbox
+from matplotlib import rcParams
+from matplotlib.path import Path
+
+# -----------------------------
+# Fast risk map renderer
+# -----------------------------
+
+PROB_VMAX = 0.60
+PROB_CMAP = "viridis"
+EVPI_CMAP = "plasma"
+SUGGESTION_CMAP = ListedColormap(['#3449d1', '#f08800', '#a8006d'])
+SUGGESTION_NAMES = np.array(["inaction", "monitoring", "spraying"])
+
+# inches of extra room right of the first render's bounding box, for wider EVPPI colorbar labels
+LAYOUT_RIGHT_SLACK = 0.3
+
+Canvas = namedtuple("Canvas", ["fig", "axs", "collections", "evpi_mappable", "bbox"])
+
+
+class RiskMapRenderer:
+    """
+    Draws the probability / EVPPI / recommendation maps from polygon paths that are built
+    once per grid, instead of going through GeoDataFrame.plot.
+
+    The figure for each number of days (axes, colorbars, ticks, layout and cropped
+    bounding box) is also built once and reused: a render only swaps each panel's paths and
+    colours, the titles and the EVPPI colorbar range, then draws the figure a single time.
+    Uses standalone Agg figures, so no pyplot global state is touched.
+    """
+
+    def __init__(self, cell_geometry):
+        paths = []
+        part_cell = []
+        for pos, geom in enumerate(cell_geometry.values):
+            if geom is None or geom.is_empty:
+                continue
+            polygons = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+            for polygon in polygons:
+                # exterior rings repeat their first point, which CLOSEPOLY stands in for
+                paths.append(Path(np.asarray(polygon.exterior.coords)[:, :2], closed=True))
+                part_cell.append(pos)
+
+        self.paths = paths
+        self.part_cell = np.asarray(part_cell, dtype=np.int64)
+        self.cell_pos = pd.Series(np.arange(len(cell_geometry)), index=cell_geometry.index)
+
+        # same aspect geopandas uses for geographic coordinates
+        minx, miny, maxx, maxy = cell_geometry.total_bounds
+        self.datalim = np.array([[minx, miny], [maxx, maxy]])
+        if cell_geometry.crs is not None and cell_geometry.crs.is_geographic:
+            self.aspect = 1 / np.cos(np.mean([miny, maxy]) * np.pi / 180)
+        else:
+            self.aspect = "equal"
+
+        self._lock = threading.Lock()
+        self._canvases = {}  # number of days -> Canvas
+
+    def _part_values(self, wdf_day, column):
+        values = np.full(len(self.cell_pos), np.nan)
+        values[self.cell_pos.reindex(wdf_day["cell_id"]).to_numpy()] = wdf_day[column].to_numpy(dtype=np.float64)
+        return values[self.part_cell]
+
+    @staticmethod
+    def _colors(values, cmap, vmin=None, vmax=None, alpha=None):
+        # like GeoDataFrame.plot, unset limits come from the plotted values
+        norm = Normalize(
+            vmin=values.min() if vmin is None else vmin,
+            vmax=values.max() if vmax is None else vmax,
+        )
+        return ScalarMappable(norm=norm, cmap=cmap).to_rgba(values, alpha=alpha)
+
+    def _fill_panel(self, collection, values, ap_parts, cmap, vmin=None, vmax=None):
+        # full grid translucent, Andhra Pradesh opaque on top. The opaque cells would hide the
+        # translucent ones under them, so both layers go into one collection, AP cells last
+        finite = np.isfinite(values)
+        ap_parts = ap_parts[finite[ap_parts]]
+        is_ap = np.zeros(len(values), dtype=bool)
+        is_ap[ap_parts] = True
+        rest = np.flatnonzero(finite & ~is_ap)
+
+        facecolors = [np.zeros((0, 4))]
+        if len(rest):
+            # the translucent layer's limits also come from the full grid
+            all_values = values[finite]
+            norm_min = all_values.min() if vmin is None else vmin
+            norm_max = all_values.max() if vmax is None else vmax
+            facecolors.append(self._colors(values[rest], cmap, norm_min, norm_max, alpha=0.5))
+        if len(ap_parts):
+            facecolors.append(self._colors(values[ap_parts], cmap, vmin, vmax))
+
+        collection.set_paths([self.paths[k] for k in np.concatenate([rest, ap_parts])])
+        collection.set_facecolor(np.concatenate(facecolors))
+
+    def _build_canvas(self, n_days):
+        fig = Figure(figsize=(4 * n_days, 8.5))
+        FigureCanvasAgg(fig)
+        axs = fig.subplots(3, n_days, sharex=True, sharey=True, squeeze=False)
+
+        collections = np.empty(axs.shape, dtype=object)
+        for (row, i), ax in np.ndenumerate(axs):
+            collections[row, i] = ax.add_collection(PathCollection([]), autolim=False)
+            ax.update_datalim(self.datalim)
+            ax.autoscale_view()
+            ax.set_aspect(self.aspect)
+        for i in range(n_days):
+            # placeholder, so the layout keeps room for the date titles
+            axs[0, i].set_title(" ")
+            axs[2, i].set_xlabel("longitude")
+        for row in range(3):
+            axs[row, 0].set_ylabel("latitude")
+
+        cbar_ax = fig.add_axes([0.78, 0.70, 0.02, 0.25])
+        sm = ScalarMappable(cmap=PROB_CMAP, norm=Normalize(vmin=0, vmax=PROB_VMAX))
+        cbar = fig.colorbar(sm, cax=cbar_ax)
+        cbar.set_label(r"predicted presence probability $p_\alpha$")
+
+        cbar_ax = fig.add_axes([0.78, 0.386, 0.02, 0.25])
+        evpi_mappable = ScalarMappable(cmap=EVPI_CMAP, norm=Normalize(vmin=0, vmax=1))
+        cbar = fig.colorbar(evpi_mappable, cax=cbar_ax)
+        cbar.set_label(r"individual EVPPI ($\text{INR}\cdot\text{ha}^{-1} \cdot\text{a}^{-1}$)")
+
+        cbar_ax = fig.add_axes([0.78, 0.078, 0.02, 0.25])
+        sm = ScalarMappable(cmap=SUGGESTION_CMAP)
+        cbar = fig.colorbar(sm, cax=cbar_ax, ticks=[0.22, 0.62, 0.96])
+        cbar.ax.set_yticklabels(SUGGESTION_NAMES)
+        for label in cbar.ax.get_yticklabels():
+            label.set_rotation(90)
+        cbar.set_label(r"decision recommendation")
+
+        # the two full draws (tight_layout, tight bbox) that later renders skip
+        fig.tight_layout(rect=[0, 0, 0.8, 1])
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(rcParams["savefig.pad_inches"])
+        bbox = Bbox.from_extents(bbox.x0, bbox.y0, bbox.x1 + LAYOUT_RIGHT_SLACK, bbox.y1)
+        return Canvas(fig, axs, collections, evpi_mappable, bbox)
+
+    def render(self, wdf_days, titles):
+        """Render one column per day (rows: probability, EVPPI, recommendation) to PNG bytes"""
+        n_days = len(wdf_days)
+        with self._lock:
+            canvas = self._canvases.get(n_days)
+            if canvas is None:
+                canvas = self._canvases[n_days] = self._build_canvas(n_days)
+
+            vmax2 = 0
+            for i, wdf_day in enumerate(wdf_days):
+                ap_parts = np.flatnonzero(self._part_values(wdf_day, "ap_within") == 1)
+                collections = canvas.collections[:, i]
+
+                self._fill_panel(collections[0], self._part_values(wdf_day, "gp_pred"), ap_parts,
+                                 PROB_CMAP, 0.0, PROB_VMAX)
+                canvas.axs[0, i].set_title(titles[i])
+
+                vmin2 = wdf_day.individual_evpi.min()
+                vmax2 = wdf_day.individual_evpi.max()
+                self._fill_panel(collections[1], self._part_values(wdf_day, "individual_evpi"), ap_parts,
+                                 EVPI_CMAP, vmin2, vmax2)
+
+                self._fill_panel(collections[2], self._part_values(wdf_day, "suggestion"), ap_parts,
+                                 SUGGESTION_CMAP)
+
+            # the colorbar follows its mappable's norm
+            canvas.evpi_mappable.set_norm(Normalize(vmin=0, vmax=vmax2))
+
+            buf = io.BytesIO()
+            canvas.fig.savefig(buf, format="png", bbox_inches=canvas.bbox)
+            return buf.getvalue()
+
+
+_renderer_lock = threading.Lock()
+_renderer = (None, None)
+
+
+def get_renderer(geo):
+    """RiskMapRenderer for the given GeoData snapshot, rebuilt only when the grid reloads."""
+    global _renderer
+    version, renderer = _renderer
+    if version == geo.version:
+        return renderer
+    with _renderer_lock:
+        if _renderer[0] != geo.version:
+            _renderer = (geo.version, RiskMapRenderer(geo.cell_geometry))
+        return _renderer[1]
@@ -0,0 +1,69 @@
+import io
+
+import numpy as np
+import pyarrow as pa
+
+# -----------------------------
+# Compact columnar encoding of risk map results
+# -----------------------------
+
+PAYLOAD_FORMATS = {
+    "npz": "application/x-npz",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def risk_columns(days, wdf_days):
+    """Long-format columns (one row per day and cell) with compact dtypes"""
+    sizes = [len(wdf_day) for wdf_day in wdf_days]
+    if not wdf_days:
+        return {
+            "day": np.empty(0, dtype=np.int32),
+            "cell_id": np.empty(0, dtype=np.int64),
+            "gp_pred": np.empty(0, dtype=np.float32),
+            "individual_evpi": np.empty(0, dtype=np.float32),
+            "suggestion": np.empty(0, dtype=np.int8),
+        }
+    return {
+        "day": np.repeat(np.asarray(days, dtype=np.int32), sizes),
+        "cell_id": np.concatenate([wdf_day["cell_id"].to_numpy() for wdf_day in wdf_days]).astype(np.int64),
+        "gp_pred": np.concatenate([wdf_day["gp_pred"].to_numpy() for wdf_day in wdf_days]).astype(np.float32),
+        "individual_evpi": np.concatenate([wdf_day["individual_evpi"].to_numpy() for wdf_day in wdf_days]).astype(np.float32),
+        "suggestion": np.concatenate([wdf_day["suggestion"].to_numpy() for wdf_day in wdf_days]).astype(np.int8),
+    }
+
+
+def encode_risk_chunks(chunks, fmt="npz", compress=True):
+    """
+    Encode per-cell results given as an iterable of (days, wdf_days) chunks as `.npz` or
+    Arrow IPC, returning (payload bytes, mimetype). Each chunk is reduced to its compact
+    columns (Arrow: written as a record batch) before the next one is computed, so only
+    one chunk's frames are alive at a time.
+    """
+    if fmt not in PAYLOAD_FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {sorted(PAYLOAD_FORMATS)}")
+
+    buf = io.BytesIO()
+    if fmt == "npz":
+        parts = {name: [column] for name, column in risk_columns([], []).items()}
+        for days, wdf_days in chunks:
+            for name, column in risk_columns(days, wdf_days).items():
+                parts[name].append(column)
+        columns = {name: np.concatenate(column_parts) for name, column_parts in parts.items()}
+        if compress:
+            np.savez_compressed(buf, **columns)
+        else:
+            np.savez(buf, **columns)
+    else:
+        schema = pa.table(risk_columns([], [])).schema
+        options = pa.ipc.IpcWriteOptions(compression="zstd" if compress else None)
+        with pa.ipc.new_file(buf, schema, options=options) as writer:
+            for days, wdf_days in chunks:
+                writer.write_table(pa.table(risk_columns(days, wdf_days), schema=schema))
+
+    return buf.getvalue(), PAYLOAD_FORMATS[fmt]
+
+
+def encode_risk_days(days, wdf_days, fmt="npz", compress=True):
+    """Encode per-cell results as `.npz` or Arrow IPC, returning (payload bytes, mimetype)"""
+    return encode_risk_chunks([(days, wdf_days)], fmt, compress)
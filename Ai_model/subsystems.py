@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+
+# -----------------------------
+# Lazily / background-loaded parts of the app
+# -----------------------------
+
+# how long a request waits for a subsystem that is still loading before answering 503
+SUBSYSTEM_WAIT_SECONDS = float(os.environ.get("SUBSYSTEM_WAIT_SECONDS", 30))
+
+
+class SubsystemUnavailable(RuntimeError):
+    """Raised when a subsystem failed to load, or is still loading after the wait timeout"""
+
+    def __init__(self, name, message):
+        super(SubsystemUnavailable, self).__init__(f"{name}: {message}")
+        self.name = name
+        self.message = message
+
+    def __reduce__(self):
+        # keeps the two-argument constructor picklable across worker processes
+        return SubsystemUnavailable, (self.name, self.message)
+
+
+class Subsystem:
+    """
+    A value built by `loader` on first use, or ahead of time in a background thread.
+
+    `get()` loads the value if nobody has yet, or waits for the thread that is loading it.
+    A failed load is remembered and reported by `status()` instead of being retried on
+    every request.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._state = "pending"
+        self._value = None
+        self._error = None
+        self._started_at = None
+        self._load_seconds = None
+
+    @property
+    def ready(self):
+        return self._state == "ready"
+
+    def peek(self):
+        """The loaded value, or None without triggering a load"""
+        return self._value if self._state == "ready" else None
+
+    def _load(self):
+        with self._lock:
+            if self._state != "pending":
+                return
+            self._state = "loading"
+            self._started_at = time.time()
+
+        started = time.perf_counter()
+        try:
+            value = self.loader()
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"
+            self._state = "failed"
+            print(f"Failed to load {self.name}: {self._error}")
+        else:
+            self._value = value
+            self._state = "ready"
+            print(f"Loaded {self.name} in {time.perf_counter() - started:.2f}s")
+        finally:
+            self._load_seconds = time.perf_counter() - started
+            self._done.set()
+
+    def start_background(self):
+        """Start loading in a daemon thread, if nothing has started loading yet"""
+        if self._state == "pending":
+            threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True).start()
+
+    def get(self, timeout=None):
+        if self._state == "pending":
+            self._load()
+        if not self._done.wait(timeout):
+            raise SubsystemUnavailable(self.name, "still loading, try again shortly")
+        if self._state == "failed":
+            raise SubsystemUnavailable(self.name, self._error)
+        return self._value
+
+    def status(self):
+        return {
+            "state": self._state,
+            "started_at": self._started_at,
+            "load_seconds": round(self._load_seconds, 3) if self._load_seconds is not None else None,
+            "error": self._error,
+        }
+
+
+class ProcessLocal:
+    """
+    A value built by `factory` on first use in each process.
+
+    Threads, event loops, executors and SQLite connections do not survive fork, so a forked
+    child (a gunicorn worker of a preloaded app) builds its own instead of using the
+    parent's. `is_valid(value)` can ask for a rebuild too, e.g. once a worker thread died.
+    """
+
+    def __init__(self, factory, is_valid=None):
+        self.factory = factory
+        self.is_valid = is_valid
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+
+    def _current(self):
+        return self._pid == os.getpid() and (self.is_valid is None or self.is_valid(self._value))
+
+    def peek(self):
+        """This process's value, or None without building one"""
+        return self._value if self._pid == os.getpid() else None
+
+    def get(self):
+        if not self._current():
+            with self._lock:
+                if not self._current():
+                    self._value = self.factory()
+                    self._pid = os.getpid()
+        return self._value
@@ -0,0 +1,88 @@
+import io
+import os
+import sys
+import json
+import tarfile
+import threading
+
+import numpy as np
+import pytest
+import requests
+import torch
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from subsystems import Subsystem
+from ingest import HSI_SHAPE, RGB_SHAPE
+
+
+def fake_runner(hsi, rgb):
+    # class 2 for every patch, so the test does not need the trained weights
+    return torch.tensor([[0.0, 0.0, 1.0]]).repeat(len(hsi), 1)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    state = app_module.DualStream(None, None, {"mode": "fp32", "enabled": True}, "eager", fake_runner, None, None)
+    monkeypatch.setattr(app_module, "dual_stream", Subsystem("dual_stream", lambda: state))
+
+    # a real server, so the upload is closed once the view returns, as under gunicorn
+    httpd = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def npy_bytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    return buf.getvalue()
+
+
+def tar_survey(n, mode="w:gz"):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for i in range(n):
+            for role, shape in (("hsi", HSI_SHAPE), ("rgb", RGB_SHAPE)):
+                data = npy_bytes(np.zeros(shape, dtype=np.float32))
+                info = tarfile.TarInfo(f"patch{i}.{role}.npy")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def npz_survey(n):
+    buf = io.BytesIO()
+    np.savez(buf, hsi=np.zeros((n,) + HSI_SHAPE, dtype=np.float32), rgb=np.zeros((n,) + RGB_SHAPE, dtype=np.float32))
+    return buf.getvalue()
+
+
+def post_bulk(server, filename, archive, **form):
+    response = requests.post(f"{server}/predict_dual_stream/bulk", files={"archive": (filename, archive)},
+                             data=form, stream=True, timeout=60)
+    return response, [json.loads(line) for line in response.iter_lines() if line]
+
+
+@pytest.mark.parametrize("filename, make_archive", [
+    ("survey.tar.gz", lambda: tar_survey(3)),
+    ("survey.tar", lambda: tar_survey(3, mode="w")),
+    ("survey.npz", lambda: npz_survey(3)),
+], ids=["tar.gz", "tar", "npz"])
+def test_bulk_streams_predictions(server, filename, make_archive):
+    response, records = post_bulk(server, filename, make_archive(), batch_size="2")
+
+    assert response.status_code == 200
+    assert len(records) == 3
+    assert all("error" not in record for record in records), records
+    assert {record["predicted_class"] for record in records} == {"yellow rust disease"}
+
+
+def test_bulk_rejects_bad_batch_size(server):
+    response = requests.post(f"{server}/predict_dual_stream/bulk", files={"archive": ("survey.npz", npz_survey(1))},
+                             data={"batch_size": "lots"}, timeout=60)
+
+    assert response.status_code == 400
+    assert "batch_size" in response.json()["error"]
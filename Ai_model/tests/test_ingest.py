@@ -0,0 +1,85 @@
+import io
+import os
+import sys
+import json
+import tarfile
+
+import numpy as np
+import pytest
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import iter_tar_survey, parse_tensor
+
+
+def npy_bytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    return buf.getvalue()
+
+
+def tar_of(names):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name in names:
+            data = npy_bytes(np.zeros((2, 2), dtype=np.float32))
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+def test_tar_survey_pairs_interleaved_members():
+    names = [f"p{i}.{role}.npy" for i in range(20) for role in ("hsi", "rgb")]
+    records = list(iter_tar_survey(tar_of(names), max_pending=2))
+
+    assert [record["id"] for record in records] == [f"p{i}" for i in range(20)]
+    assert all("error" not in record for record in records)
+
+
+def test_tar_survey_bounds_patches_grouped_by_role():
+    # `tar cf survey.tar hsi rgb`: every hsi member before the first rgb one
+    names = [f"hsi/p{i}.hsi.npy" for i in range(20)] + [f"rgb/p{i}.rgb.npy" for i in range(20)]
+    records = list(iter_tar_survey(tar_of(names), max_pending=4))
+
+    assert len(records) == 20
+    assert all("error" in record for record in records[:16])
+    assert "next to each other" in records[0]["error"]
+    # only the last max_pending patches could still be paired
+    assert [record["id"] for record in records if "error" not in record] == [f"p{i}" for i in range(16, 20)]
+
+
+def safetensors_bytes(header, data=b""):
+    header = json.dumps(header).encode("utf-8")
+    return len(header).to_bytes(8, "little") + header + data
+
+
+def test_safetensors_round_trip():
+    data = np.arange(6, dtype=np.float32).tobytes()
+    tensor = parse_tensor(safetensors_bytes({"hsi": {"dtype": "F32", "shape": [2, 3], "data_offsets": [0, 24]}}, data),
+                          "hsi")
+
+    assert torch.equal(tensor, torch.arange(6, dtype=torch.float32).view(2, 3))
+
+
+@pytest.mark.parametrize("header", [
+    ["not", "a", "dict"],
+    {"x": [1, 2]},
+    {"x": {"shape": [2], "data_offsets": [0, 8]}},
+    {"x": {"dtype": "F32", "data_offsets": [0, 8]}},
+    {"x": {"dtype": 7, "shape": [2], "data_offsets": [0, 8]}},
+    {"x": {"dtype": "F32", "shape": "2", "data_offsets": [0, 8]}},
+    {"x": {"dtype": "F32", "shape": [-2], "data_offsets": [0, 8]}},
+    {"x": {"dtype": "F32", "shape": [2.5], "data_offsets": [0, 8]}},
+    {"x": {"dtype": "F32", "shape": [2], "data_offsets": [8]}},
+    {"x": {"dtype": "F32", "shape": [2], "data_offsets": [-8, 0]}},
+    {"x": {"dtype": "F32", "shape": [6], "data_offsets": [-8, 16]}},
+    {"x": {"dtype": "F32", "shape": [2], "data_offsets": [8, 0]}},
+    {"x": {"dtype": "F32", "shape": [2], "data_offsets": [0, 64]}},
+    {"x": {"dtype": "F32", "shape": [2 ** 40, 2 ** 40], "data_offsets": [0, 8]}},
+], ids=lambda header: json.dumps(header)[:40])
+def test_malformed_safetensors_headers_are_rejected(header):
+    with pytest.raises(ValueError):
+        parse_tensor(safetensors_bytes(header, bytes(16)), "hsi")
@@ -3,18 +3,42 @@ from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.schema import HumanMessage
-import os, base64
+import os, io, base64
+import asyncio, queue, threading
 
-import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from chat_cache import ChatCache
+from chat_history import HistoryManager
+from subsystems import ProcessLocal
 
 load_dotenv()
 key = os.getenv("google_api_key")
 
-llm = ChatGoogleGenerativeAI(
-    model="models/gemini-2.0-flash",
-    temperature=0.7,
-    google_api_key=key
-)
+# "gemini", or "stub" for a local fake model to measure latency / throughput offline
+CHAT_LLM = os.getenv("CHAT_LLM", "gemini")
+
+STUB_RESPONSES = [
+    "Yellow rust: spray propiconazole 25 EC at 0.1% when pustules first appear, repeat after 15 days if needed.",
+    "Apply urea in two splits for wheat: half at crown root initiation, half at tillering, about 120 kg N per hectare in total.",
+    "Check the lower leaves for aphids and spray neem oil 3% if more than 10 aphids per tiller are seen.",
+]
+
+
+def build_llm():
+    if CHAT_LLM == "stub":
+        from langchain_core.language_models import FakeListChatModel
+
+        # streams one character at a time, with a per-token delay like a remote model
+        return FakeListChatModel(responses=STUB_RESPONSES, sleep=float(os.getenv("CHAT_STUB_TOKEN_DELAY", 0.02)))
+    return ChatGoogleGenerativeAI(
+        model="models/gemini-2.0-flash",
+        temperature=0.7,
+        google_api_key=key
+    )
+
+
+llm = build_llm()
 
 prompt = PromptTemplate(
     input_variables=['messages', 'query', 'language'],
@@ -45,25 +69,130 @@ Answer in **{language}** (no Unicode escape codes, plain readable text):
 
 chain = LLMChain(llm=llm, prompt=prompt)
 
+summary_prompt = PromptTemplate(
+    input_variables=['summary', 'turns', 'words'],
+    template="""
+Summarize this conversation between a farmer and an agricultural expert in at most {words} words.
+Keep the crops, locations, problems, products, doses and advice already given; drop greetings.
+
+Summary so far: {summary}
+
+Newer messages:
+{turns}
+
+Summary:
+"""
+)
+
+summary_chain = summary_prompt | llm
+
+
+def summarize_history(summary, turns):
+    """Fold `turns` into the running `summary` of a conversation"""
+    res = summary_chain.invoke({
+        "summary": summary or "None",
+        "turns": "\n".join(turns),
+        "words": int(history.summary_tokens * 0.75),
+    })
+    return res.content.strip()
+
+
+# prompt history stays under a token budget: recent turns verbatim, older ones summarized
+history = HistoryManager(
+    summarize_history,
+    budget_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", 800)),
+    summary_tokens=int(os.getenv("CHAT_SUMMARY_TOKENS", 200)),
+)
+
+# repeated text questions (same normalized query, language and recent context) skip the LLM
+answer_cache = None
+if int(os.getenv("CHAT_CACHE_ENTRIES", 1024)) > 0:
+    answer_cache = ChatCache(
+        max_entries=int(os.getenv("CHAT_CACHE_ENTRIES", 1024)),
+        max_bytes=int(float(os.getenv("CHAT_CACHE_MB", 8)) * 1024 * 1024),
+        ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", 24 * 3600)),
+        db_path=os.getenv("CHAT_CACHE_DB") or None,
+        context_turns=int(os.getenv("CHAT_CACHE_CONTEXT_TURNS", 4)),
+    )
+
 # ---------- TEXT ONLY ----------
 def getAnswer(messages, query, language):
-    res = chain.invoke({"messages": messages, "query": query, "language": language})
+    cache_key = answer_cache.key(query, language, messages) if answer_cache is not None else None
+    if cache_key is not None:
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    res = chain.invoke({"messages": history.compact(messages), "query": query, "language": language})
+    if cache_key is not None:
+        answer_cache.put(cache_key, res["text"])
     return res["text"]
 
 # ---------- IMAGE + TEXT ----------
-def getAnswerWithImage(messages, query, language, image_path):
+CHAT_IMAGE_MAX_SIDE = int(os.getenv("CHAT_IMAGE_MAX_SIDE", 1024))
+CHAT_IMAGE_QUALITY = int(os.getenv("CHAT_IMAGE_QUALITY", 80))
+CHAT_IMAGE_MAX_BYTES = int(os.getenv("CHAT_IMAGE_MAX_BYTES", 300 * 1024))
+
+
+def check_image(data):
+    """Raise ValueError unless `data` is an image PIL can read; only the headers are parsed"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise ValueError("The uploaded file is not a readable image")
+    except Image.DecompressionBombError:
+        raise ValueError("The uploaded image has too many pixels")
+
+
+def prepare_image(data, max_side=CHAT_IMAGE_MAX_SIDE, quality=CHAT_IMAGE_QUALITY, max_bytes=CHAT_IMAGE_MAX_BYTES):
+    """
+    Downscale an uploaded photo to at most `max_side` pixels and re-encode it as JPEG,
+    lowering quality (then size) until it fits in `max_bytes`. Works on bytes in memory.
+    Quality only drops to 40, or not at all when `quality` starts below that.
+    """
+    quality = max(1, min(quality, 95))
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format == "JPEG":
+            # let libjpeg skip most of a 12 MP photo while decoding
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    while True:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        # always encodes at least once, at `quality`
+        for q in range(quality, min(quality, 40) - 1, -10):
+            buf = io.BytesIO()
+            image.save(buf, "JPEG", quality=q, optimize=True)
+            if buf.tell() <= max_bytes:
+                return buf.getvalue()
+        if max_side <= 256:
+            return buf.getvalue()
+        max_side = int(max_side * 0.75)
+
+
+def getAnswerWithImage(messages, query, language, image):
     """
     Handles queries with both text + image (crops, soil, leaves, graphs, charts).
+    `image` is the uploaded file's bytes (or, for older callers, a path to it).
     """
-    with open(image_path, "rb") as f:
-        img_b64 = base64.b64encode(f.read()).decode("utf-8")
+    # Call Gemini with multimodal input
+    response = llm.invoke([image_message(messages, query, language, image)])
+    return response.content
+
+
+def image_message(messages, query, language, image):
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            image = f.read()
+    img_b64 = base64.b64encode(prepare_image(image)).decode("utf-8")
 
     content = [
         {
             "type": "text",
             "text": f"""
 You are a professional agricultural expert.
-Previous messages: {messages}
+Previous messages: {history.compact(messages)}
 User query: {query}
 Language: {language}
 
@@ -80,110 +209,103 @@ Instructions:
             "image_url": f"data:image/jpeg;base64,{img_b64}"
         }
     ]
+    return HumanMessage(content=content)
 
-    # Call Gemini with multimodal input
-    response = llm.invoke([HumanMessage(content=content)])
-    return response.content
 
+# ---------- STREAMING ----------
+text_stream = prompt | llm
 
-e_c_loss_treatment = 0                                        
-e_c_loss_no_treatment = 868                                   
-e_c_treatment_application = 795                                 
-e_c_monitoring = 48                                          
-e_c_treatment_treatment = e_c_treatment_application/10 - 24 
-
-def expected_cost(
-    p_pest,                     # probability of pest occurence
-    treatment,                  # treatment indicator (decision variable)
-    e_c_loss_treatment,         # expected cost of yield loss given treatment
-    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-    e_c_treatment_treatment,    # expected cost of treatment given treatment
-):
-    e_c_loss_pest = treatment * e_c_loss_treatment \
-             + (1-treatment) * e_c_loss_no_treatment
-    e_c_loss = p_pest * e_c_loss_pest
-
-    e_c_treatment = treatment * e_c_treatment_treatment
-    return e_c_loss + e_c_treatment
-
-
-def expected_hat_cost(
-    p_pest,                     # probability of pest occurence
-    treatment,                  # treatment indicator (decision variable)
-    e_c_loss_treatment,         # expected cost of yield loss given treatment
-    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-    e_c_treatment_treatment,    # expected cost of treatment given treatment
-):
-    e_c = expected_cost(
-        p_pest,
-        treatment,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    )
 
-    shift = p_pest * e_c_loss_no_treatment
-    return e_c - shift
-
-def e_c_hat_given_no_ppi(
-    p_pest,                     # probability of pest occurence
-    e_c_loss_treatment,         # expected cost of yield loss given treatment
-    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-    e_c_treatment_treatment,    # expected cost of treatment given treatment
-):
-    e_c_treatment = expected_hat_cost(
-        p_pest,
-        1,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    )
-    e_c_no_treatment = expected_hat_cost(
-        p_pest,
-        0,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    )
-    return np.minimum(e_c_treatment, e_c_no_treatment)
-
-def e_c_hat_given_ppi(
-    p_pest,                     # probability of pest occurence
-    e_c_loss_treatment,         # expected cost of yield loss given treatment
-    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-    e_c_treatment_treatment,    # expected cost of treatment given treatment
-):
-    return p_pest * expected_hat_cost(
-        1,
-        1,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    )
+def _chunk_text(chunk):
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+async def astream_answer(messages, query, language):
+    """Async generator over the answer tokens of a text query"""
+    # compaction may call the LLM for a summary, keep it off the event loop
+    context = await asyncio.to_thread(history.compact, messages)
+    async for chunk in text_stream.astream({"messages": context, "query": query, "language": language}):
+        text = _chunk_text(chunk)
+        if text:
+            yield text
+
+
+async def astream_answer_with_image(messages, query, language, image):
+    """Async generator over the answer tokens of an image + text query"""
+    # decoding and downscaling happen off the event loop
+    message = await asyncio.to_thread(image_message, messages, query, language, image)
+    async for chunk in llm.astream([message]):
+        text = _chunk_text(chunk)
+        if text:
+            yield text
+
+
+def _start_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="chat-event-loop", daemon=True).start()
+    return loop
+
+
+# one event loop thread multiplexes every in-flight streaming call
+_loop = ProcessLocal(_start_loop)
+
+
+def iter_async(agen):
+    """Drive an async generator on the chat event loop and yield its items to a sync caller"""
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((True, item))
+        except Exception as e:
+            items.put((False, e))
+        else:
+            items.put((False, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _loop.get())
+    try:
+        while True:
+            ok, item = items.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        # client went away: stop pulling tokens from the model
+        future.cancel()
+
+
+def _cache_stream(cache_key, tokens):
+    answer = []
+    for token in tokens:
+        answer.append(token)
+        yield token
+    # only complete answers are cached
+    answer_cache.put(cache_key, "".join(answer))
+
+
+def streamAnswer(messages, query, language):
+    if answer_cache is None:
+        return iter_async(astream_answer(messages, query, language))
+
+    cache_key = answer_cache.key(query, language, messages)
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        return iter([cached])
+    return _cache_stream(cache_key, iter_async(astream_answer(messages, query, language)))
+
+
+def streamAnswerWithImage(messages, query, language, image):
+    return iter_async(astream_answer_with_image(messages, query, language, image))
 
-def evppi(
-    p_pest,                     # probability of pest occurence
-    e_c_loss_treatment,         # expected cost of yield loss given treatment
-    e_c_loss_no_treatment,      # expected cost of yield loss given no treatment
-    e_c_treatment_treatment,    # expected cost of treatment given treatment
-):
-    return e_c_hat_given_no_ppi(
-        p_pest,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    ) - \
-    e_c_hat_given_ppi(
-        p_pest,
-        e_c_loss_treatment,
-        e_c_loss_no_treatment,
-        e_c_treatment_treatment,
-    )
 
-def e_u_gamma(p_alpha, gamma):
-    if gamma == 0:
-        return p_alpha * 0
-    elif gamma == 1:
-        return p_alpha * (e_c_loss_no_treatment - e_c_loss_treatment - e_c_treatment_treatment) - e_c_monitoring
-    elif gamma == 2:
-        return p_alpha * (e_c_loss_no_treatment - e_c_loss_treatment) - e_c_treatment_treatment
\ No newline at end of file
+# decision functions used to live here
+from decision import e_c_loss_treatment, e_c_loss_no_treatment, e_c_treatment_application, e_c_monitoring, \
+    e_c_treatment_treatment, expected_cost, expected_hat_cost, e_c_hat_given_no_ppi, e_c_hat_given_ppi, \
+    evppi, e_u_gamma, Decision, decide
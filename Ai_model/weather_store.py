@@ -0,0 +1,124 @@
+import os
+import json
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# -----------------------------
+# Date-partitioned weather store
+# -----------------------------
+
+INDEX_FILE = "index.json"
+
+
+def _date_key(date):
+    date = float(date)
+    return str(int(date)) if date.is_integer() else str(date)
+
+
+def _write_partition(table, path):
+    # written next to the target and renamed, so readers never map a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def partition_by_date(source_path, store_dir, date_column="date"):
+    """
+    Split the processed weather feather into one Arrow IPC file per date.
+    The rows are sorted by date once, and each partition is written as a zero-copy slice.
+    """
+    table = feather.read_table(source_path, memory_map=True)
+    table = table.sort_by(date_column)
+    dates = table.column(date_column).to_numpy()
+
+    unique_dates, starts = np.unique(dates, return_index=True)
+    ends = np.append(starts[1:], len(dates))
+
+    os.makedirs(store_dir, exist_ok=True)
+    partitions = {}
+    for date, start, end in zip(unique_dates, starts, ends):
+        file_name = f"{_date_key(date)}.arrow"
+        _write_partition(table.slice(start, end - start), os.path.join(store_dir, file_name))
+        partitions[_date_key(date)] = {"file": file_name, "rows": int(end - start)}
+
+    source_stat = os.stat(source_path)
+    index = {
+        "source_mtime": source_stat.st_mtime,
+        "source_size": source_stat.st_size,
+        "date_column": date_column,
+        "partitions": partitions,
+    }
+    tmp_path = os.path.join(store_dir, f"{INDEX_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(store_dir, INDEX_FILE))
+
+    print(f"Weather store built: {len(partitions)} daily partitions in {store_dir}")
+    return index
+
+
+class WeatherStore:
+    """
+    Memory-mapped, per-date view of `total_processed.feather`.
+    The partitions are (re)built from the source file whenever it is newer than the index,
+    and a day slice only touches the rows of that day.
+    """
+
+    def __init__(self, source_path, store_dir=None, date_column="date"):
+        self.source_path = source_path
+        self.store_dir = store_dir or os.path.splitext(source_path)[0] + "_by_date"
+        self.date_column = date_column
+        self._lock = threading.Lock()
+        self._schema = None
+        self.index = self._load_index()
+
+    def _load_index(self):
+        source_stat = os.stat(self.source_path)
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["source_mtime"] == source_stat.st_mtime and \
+                    index["source_size"] == source_stat.st_size and \
+                    index["date_column"] == self.date_column:
+                return index
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return partition_by_date(self.source_path, self.store_dir, self.date_column)
+
+    def __len__(self):
+        return sum(p["rows"] for p in self.index["partitions"].values())
+
+    @property
+    def dates(self):
+        return sorted(float(d) for d in self.index["partitions"])
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            with self._lock:
+                if self._schema is None:
+                    # only the footer is read: from a partition, or from the source (feather v2 is Arrow IPC)
+                    partitions = self.index["partitions"]
+                    path = os.path.join(self.store_dir, next(iter(partitions.values()))["file"]) \
+                        if partitions else self.source_path
+                    with pa.memory_map(path, "r") as source:
+                        self._schema = pa.ipc.open_file(source).schema
+        return self._schema
+
+    def day_table(self, day):
+        """Arrow table backed by the memory-mapped partition for `day`."""
+        partition = self.index["partitions"].get(_date_key(day))
+        if partition is None:
+            return self.schema.empty_table()
+        source = pa.memory_map(os.path.join(self.store_dir, partition["file"]), "r")
+        return pa.ipc.open_file(source).read_all()
+
+    def day(self, day):
+        """Rows of `day` as a pandas frame (replaces `wdf.loc[wdf["date"] == day]`)."""
+        return self.day_table(day).to_pandas(split_blocks=True)